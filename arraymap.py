@@ -0,0 +1,164 @@
+import logging
+import random
+
+import numpy as np
+
+from mapa import Map, Tiles, VITAL_SPACE
+
+logger = logging.getLogger("Map")
+logger.setLevel(logging.DEBUG)
+
+
+class ArrayMap(Map):
+    """Map backed by a (hor_tiles, ver_tiles) uint8 array of Tiles.
+
+    Indexing follows Map.map, tiles[x, y]. The public queries behave exactly
+    like Map's; map returns the list of lists representation for callers
+    that serialise it."""
+
+    def __init__(self, level=1, enemies=0, size=(VITAL_SPACE+10, VITAL_SPACE+10), mapa=None, enemies_spawn=None, empty=False, rng=None):
+
+        assert size[0] > VITAL_SPACE+9
+        assert size[1] > VITAL_SPACE+9
+
+        if rng is None:
+            rng = random  # module level generator, pass a random.Random for reproducible maps
+        self._level = level
+        self._size = tuple(size)
+        self.hor_tiles = size[0]
+        self.ver_tiles = size[1]
+        self._walls = {}  # ordered set of wall positions, mirrored in self.tiles
+        self._fields = {}
+        self._shared = False  # tiles shared with a copy, see copy()
+        if enemies_spawn:
+            self._enemies_spawn = enemies_spawn
+        else:
+            self._enemies_spawn = []
+
+        if mapa is None:
+            logger.info("Generating a MAP")
+            rng = np.random.default_rng(rng.getrandbits(64))
+
+            x, y = np.indices(self._size)
+            stones = (
+                (x == 0) | (x == self.hor_tiles - 1) | (y == 0) | (y == self.ver_tiles - 1)
+            ) | ((x % 2 == 0) & (y % 2 == 0))
+            self.tiles = np.where(stones, Tiles.STONE, Tiles.PASSAGE).astype(np.uint8)
+            if not empty:  # give bomberman some room
+                walls = (
+                    ~stones
+                    & (x >= VITAL_SPACE)
+                    & (y >= VITAL_SPACE)
+                    & (rng.integers(0, 101, self._size) > 70 + 25 / level)
+                )
+                self.tiles[walls] = Tiles.WALL
+            self._walls = dict.fromkeys(map(tuple, np.argwhere(self.tiles == Tiles.WALL).tolist()))
+
+            for _ in range(enemies):
+                free = np.argwhere(self.tiles[VITAL_SPACE:, VITAL_SPACE:] == Tiles.PASSAGE)
+                x, y = (free[rng.integers(len(free))] + VITAL_SPACE).tolist()
+                self._enemies_spawn.append((x, y))
+                logger.debug(f"Spawn enemy at ({x}, {y})")
+                # create a vital space for enemies:
+                vital = self.tiles[x - 1 : x + 2, y - 1 : y + 2]
+                for rx, ry in np.argwhere(vital == Tiles.WALL).tolist():
+                    del self._walls[(x + rx - 1, y + ry - 1)]
+                vital[vital == Tiles.WALL] = Tiles.PASSAGE
+
+            if not empty:
+                walls = self.walls
+                self.exit_door = walls[rng.integers(len(walls))]
+                walls.remove(self.exit_door)
+                self.powerup = walls[rng.integers(len(walls))]  # hide powerups behind walls only
+
+        else:
+            logger.info("Loading MAP")
+            if isinstance(mapa, (bytes, bytearray, memoryview)):
+                self.tiles = np.frombuffer(mapa, dtype=np.uint8).reshape(self._size).copy()
+            else:
+                self.tiles = np.array(mapa, dtype=np.uint8)
+            self.tiles[1, 1] = Tiles.PASSAGE  # bomberman spawn is never a wall
+            self._walls = dict.fromkeys(map(tuple, np.argwhere(self.tiles == Tiles.WALL).tolist()))
+        self._bomberman_spawn = (1, 1)  # Always true
+
+    @property
+    def map(self):
+        return self.tiles.tolist()
+
+    @map.setter
+    def map(self, mapa):
+        self.tiles = np.array(mapa, dtype=np.uint8)
+
+    def buffer(self):
+        """Zero-copy view of the tiles, x-major, one byte per tile."""
+        return memoryview(self.tiles).cast("B")
+
+    @property
+    def walls(self):
+        return list(self._walls)
+
+    def _unshare(self):
+        if self._shared:
+            self.tiles = self.tiles.copy()
+            self._walls = dict(self._walls)
+            self._shared = False
+
+    @walls.setter
+    def walls(self, walls):
+        self._unshare()
+        self.tiles[self.tiles == Tiles.WALL] = Tiles.PASSAGE
+        self._walls = dict.fromkeys((x, y) for x, y in walls)
+        for x, y in self._walls:
+            self.tiles[x, y] = Tiles.WALL
+        self._fields = {}
+
+    def remove_wall(self, wall):
+        self._unshare()
+        del self._walls[wall]
+        self.tiles[wall] = Tiles.PASSAGE
+        for field in self._fields.values():
+            field.wall_removed(wall)
+
+    def wall_mask(self):
+        return self.tiles == Tiles.WALL
+
+    def stone_mask(self):
+        return self.tiles == Tiles.STONE
+
+    def open_mask(self, wallpass=False):
+        """Boolean array of the tiles a character can stand on."""
+        if wallpass:
+            return self.tiles != Tiles.STONE
+        return self.tiles == Tiles.PASSAGE
+
+    def neighbours(self, pos, wallpass=False):
+        """Open tiles reachable from pos in one step, in "wasd" order."""
+        return [
+            npos
+            for npos in (self.calc_pos(pos, d, wallpass) for d in "wasd")
+            if npos != pos
+        ]
+
+    def get_tile(self, pos):
+        return Tiles(self.tiles[pos[0], pos[1]])
+
+    def is_blocked(self, pos, wallpass=False):
+        x, y = pos
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles):
+            return True
+        tile = self.tiles[x, y]
+        if tile == Tiles.STONE or (not wallpass and tile == Tiles.WALL):
+            return True
+        return False
+
+    def is_stone(self, pos):
+        x, y = pos
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles): #everything outside of map is stone
+            return True
+        return bool(self.tiles[x, y] == Tiles.STONE)
+
+    def is_wall(self, pos):
+        x, y = pos
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles):
+            return False
+        return bool(self.tiles[x, y] == Tiles.WALL)
@@ -0,0 +1,298 @@
+"""Benchmarks of the engine hot paths, with baselines to catch slowdowns.
+
+    $ python3 bench.py run -o current.json
+    $ python3 bench.py compare benchmarks/baseline.json current.json
+
+Every benchmark runs a fixed amount of work a few times and keeps the best
+time per operation, the least disturbed by the rest of the machine.
+compare() flags the benchmarks that got slower than the baseline by more
+than the threshold. Baselines only compare on the same machine and Python:
+after a deliberate change, `run -o benchmarks/baseline.json` records a new one.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # viewer benchmarks draw offscreen
+
+import argparse
+import fnmatch
+import functools
+import json
+import platform
+import random
+import sys
+import time
+
+from game import Bomb, Game, LEVEL_ENEMIES, MAP_SIZE
+from headless import quiet
+from mapa import Map, Tiles
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+VERSION = 1
+REPEAT = 5
+THRESHOLD = 0.25  # slower than the baseline by more than this is a regression
+
+LEVELS = (1, 5, 10, 15)
+SIZES = (MAP_SIZE, (101, 61))
+SEED = 1
+KEYS = ["w", "a", "s", "d", "B", "", ""]  # a random player, idle now and then
+
+BENCHMARKS = {}  # name -> setup() returning (run, operations done by each run())
+
+
+def map_classes():
+    classes = {"map": Map}
+    try:
+        from arraymap import ArrayMap  # requires numpy
+    except ImportError:
+        pass
+    else:
+        classes["arraymap"] = ArrayMap
+    return classes
+
+
+def new_map(map_class, level, size=MAP_SIZE, seed=SEED):
+    return map_class(
+        level=level, size=size, enemies=len(LEVEL_ENEMIES[level]), rng=random.Random(seed)
+    )
+
+
+def dense_map(map_class, size=MAP_SIZE):
+    """Map with a wall on every cell that isn't a stone, but the spawn."""
+    empty = Map(size=size, empty=True)
+    tiles = [
+        [Tiles.WALL if tile == Tiles.PASSAGE else tile for tile in column]
+        for column in empty.map
+    ]
+    return map_class(size=size, mapa=tiles)
+
+
+def play(level, ticks, seed=SEED):
+    """States of a seeded random player, new games start as the old ones end."""
+    rng = random.Random(seed)
+    game = Game(level=level, seed=seed)
+    game.start("bench")
+    states = []
+    while len(states) < ticks:
+        if not game.running:
+            game.start("bench")
+        states.append(game.step(rng.choice(KEYS)))
+    return game, states
+
+
+def map_generation(map_class, level, size):
+    seeds = range(10)
+
+    def run():
+        for seed in seeds:
+            new_map(map_class, level, size, seed)
+
+    return run, len(seeds)
+
+
+def map_queries(map_class):
+    mapa = new_map(map_class, 15)
+    cells = [(x, y) for x in range(mapa.hor_tiles) for y in range(mapa.ver_tiles)]
+
+    def run():
+        for cell in cells:
+            mapa.is_blocked(cell)
+            for direction in "wasd":
+                mapa.calc_pos(cell, direction)
+
+    return run, 5 * len(cells)
+
+
+def bomb_in_range(map_class):
+    mapa = dense_map(map_class)
+    rng = random.Random(SEED)
+    bombs = [
+        (x, y)
+        for x in range(1, mapa.hor_tiles - 1)
+        for y in range(1, mapa.ver_tiles - 1)
+        if not mapa.is_stone((x, y))
+    ]
+    targets = [rng.choice(bombs) for _ in range(10)]  # bomberman and the enemies
+
+    def run():
+        for pos in bombs:
+            bomb = Bomb(pos, mapa, radius=6)
+            for target in targets:
+                bomb.in_range(target)
+
+    return run, len(bombs) * len(targets)
+
+
+def tick(level):
+    ticks = 200
+    rng = random.Random(SEED)
+    keys = [rng.choice(KEYS) for _ in range(ticks)]
+
+    def run():
+        game = Game(level=level, seed=SEED)
+        game.start("bench")
+        for key in keys:
+            if not game.running:
+                game.start("bench")
+            game.step(key)
+
+    return run, ticks
+
+
+def state_json(level):
+    game, states = play(level, 100)
+
+    def run():
+        for state in states:
+            game._state = state
+            game.state
+
+    return run, len(states)
+
+
+def state_binary(level):
+    from protocol import BinaryEncoder
+
+    _, states = play(level, 100)
+    encoder = BinaryEncoder()
+
+    def run():
+        for state in states:
+            encoder.encode_state(state)
+
+    return run, len(states)
+
+
+def viewer_frame(level):
+    import render  # pygame
+
+    game, states = play(level, 100)
+    info = dict(game.info(), highscores=[])
+
+    def run():
+        renderer = render.Renderer(info)
+        for state in states:
+            renderer.frame(state)
+
+    return run, len(states)
+
+
+for name, map_class in map_classes().items():
+    for level in LEVELS:
+        for size in SIZES:
+            BENCHMARKS[f"{name}/generate/level{level}/{size[0]}x{size[1]}"] = functools.partial(
+                map_generation, map_class, level, size
+            )
+    BENCHMARKS[f"{name}/is_blocked+calc_pos"] = functools.partial(map_queries, map_class)
+    BENCHMARKS[f"{name}/bomb_in_range/dense"] = functools.partial(bomb_in_range, map_class)
+for level in LEVELS:
+    BENCHMARKS[f"game/tick/level{level}"] = functools.partial(tick, level)
+BENCHMARKS["game/state/json"] = functools.partial(state_json, 15)
+BENCHMARKS["game/state/binary"] = functools.partial(state_binary, 15)
+BENCHMARKS["viewer/frame"] = functools.partial(viewer_frame, 15)
+
+
+def measure(setup, repeat=REPEAT, clock=time.perf_counter):
+    """Best and median seconds per operation over repeat runs."""
+    run, operations = setup()
+    times = []
+    for _ in range(repeat):
+        start = clock()
+        run()
+        times.append((clock() - start) / operations)
+    times.sort()
+    return {"seconds": times[0], "median": times[len(times) // 2], "operations": operations}
+
+
+def run_all(patterns=("*",), repeat=REPEAT, out=None):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = measure(setup, repeat)
+        if out:
+            print(f"{name:42} {results[name]['seconds'] * 1e6:10.2f}us", file=out)
+    return {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+
+
+def save(results, filename):
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, "w") as outfile:
+        json.dump(results, outfile, indent=1, sort_keys=True)
+        outfile.write("\n")
+
+
+def load(filename):
+    with open(filename) as infile:
+        results = json.load(infile)
+    if results.get("version") != VERSION:
+        raise ValueError(f"{filename}: unsupported benchmark version {results.get('version')}")
+    return results
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """(name, baseline, current, ratio, slower) of the benchmarks in both results."""
+    rows = []
+    for name, result in sorted(current["benchmarks"].items()):
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name]["seconds"]
+        ratio = result["seconds"] / before if before else 1.0
+        rows.append((name, before, result["seconds"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    quiet()
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    runner = commands.add_parser("run", help="run the benchmarks")
+    runner.add_argument("-o", "--output", help="save the results to this JSON file")
+    checker = commands.add_parser("compare", help="flag the benchmarks slower than a baseline")
+    checker.add_argument("baseline", nargs="?", default=BASELINE)
+    checker.add_argument("current", nargs="?", help="results to compare, runs the benchmarks if none")
+    checker.add_argument(
+        "--threshold", help="tolerated slowdown, 0.25 is 25%%", type=float, default=THRESHOLD
+    )
+    for command in (runner, checker):
+        command.add_argument(
+            "-k", dest="patterns", action="append", help="only run the benchmarks matching this glob"
+        )
+        command.add_argument("--repeat", help="runs of each benchmark", type=int, default=REPEAT)
+    commands.add_parser("list", help="list the benchmarks")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print("\n".join(BENCHMARKS))
+        sys.exit(0)
+
+    patterns = args.patterns or ["*"]
+    if args.command == "run":
+        results = run_all(patterns, args.repeat, out=sys.stdout)
+        if args.output:
+            save(results, args.output)
+        sys.exit(0)
+
+    baseline = load(args.baseline)
+    if args.current:
+        current = load(args.current)
+    else:
+        current = run_all(patterns, args.repeat, out=sys.stderr)
+    if (baseline["python"], baseline["machine"]) != (current["python"], current["machine"]):
+        print(
+            f"warning: baseline from Python {baseline['python']} on {baseline['machine']}",
+            file=sys.stderr,
+        )
+    slower = 0
+    for name, before, after, ratio, regressed in compare(baseline, current, args.threshold):
+        slower += regressed
+        print(
+            f"{'SLOWER' if regressed else 'OK':7} {name:42}"
+            f" {before * 1e6:10.2f}us {after * 1e6:10.2f}us {ratio:6.2f}x"
+        )
+    sys.exit(1 if slower else 0)
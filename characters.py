@@ -113,7 +113,8 @@ class Enemy(Character):
     def points(self):
         return self._points
 
-    def move(self, mapa, bomberman, bombs, enemies):
+    def move(self, mapa, bomberman, bombs, occupied):
+        """Move one step, occupied holds the positions of the other enemies."""
         if not self.ready():
             return
 
@@ -125,25 +126,31 @@ class Enemy(Character):
                 self.lastdir = (self.lastdir + 1) % len(self.dir)
 
         elif self._smart == Smart.NORMAL:
-            enemies_pos = [e.pos for e in enemies if e.id != self.id]
-            open_pos = [pos for pos in [mapa.calc_pos(self.pos, d, self._wallpass) for d in DIR] if pos not in [self.lastpos]+enemies_pos]
+            open_pos = [pos for pos in [mapa.calc_pos(self.pos, d, self._wallpass) for d in DIR] if pos != self.lastpos and pos not in occupied]
             if open_pos == []:
                 new_pos = self.lastpos
             else:
-                next_pos = sorted(open_pos, key=lambda pos: distance(bomberman.pos, pos), reverse=True)
-                new_pos = next_pos[0]
+                new_pos = max(open_pos, key=lambda pos: distance(bomberman.pos, pos))
 
         elif self._smart == Smart.HIGH:
-            enemies_pos = [e.pos for e in enemies if e.id != self.id]
-            open_pos = [pos for pos in [mapa.calc_pos(self.pos, d, self._wallpass) for d in DIR] if pos not in [self.lastpos]+enemies_pos]
+            open_pos = [pos for pos in [mapa.calc_pos(self.pos, d, self._wallpass) for d in DIR] if pos != self.lastpos and pos not in occupied]
             if open_pos == []:
                 new_pos = self.lastpos
             else:
                 if len(bombs):
-                    next_pos = sorted(open_pos, key=lambda pos: distance(bombs[0].pos, pos), reverse=True)
+                    new_pos = max(open_pos, key=lambda pos: distance(bombs[0].pos, pos))
                 else:
-                    next_pos = sorted(open_pos, key=lambda pos: distance(bomberman.pos, pos), reverse=True)
-                new_pos = next_pos[0]
+                    new_pos = max(open_pos, key=lambda pos: distance(bomberman.pos, pos))
+
+        elif self._smart == Smart.PATH:
+            open_pos = [pos for pos in [mapa.calc_pos(self.pos, d, self._wallpass) for d in DIR] if pos != self.lastpos and pos not in occupied]
+            if len(bombs):
+                # run from the bombs along the map, cells they can't reach are safest
+                field = mapa.distance_field([b.pos for b in bombs], self._wallpass)
+                new_pos = max(open_pos, key=lambda pos: field.get(pos, math.inf), default=self.pos)
+            else:
+                field = mapa.distance_field([bomberman.pos], self._wallpass)
+                new_pos = min([pos for pos in open_pos if pos in field], key=field.get, default=self.pos)
 
         self.lastpos = self.pos
         self.pos = new_pos
@@ -156,6 +163,21 @@ class Enemy(Character):
         return False
 
 
+def move_enemies(enemies, mapa, bomberman, bombs):
+    """Move all enemies in order, sharing one occupancy index built per tick."""
+    occupied = {}  # position -> number of enemies there
+    for e in enemies:
+        occupied[e.pos] = occupied.get(e.pos, 0) + 1
+
+    for e in enemies:
+        # an enemy does not block itself
+        occupied[e.pos] -= 1
+        if not occupied[e.pos]:
+            del occupied[e.pos]
+        e.move(mapa, bomberman, bombs, occupied)
+        occupied[e.pos] = occupied.get(e.pos, 0) + 1
+
+
 class Balloom(Enemy):
     def __init__(self, pos):
         super().__init__(
@@ -200,3 +222,9 @@ class Pass(Enemy):
         super().__init__(
             pos, self.__class__.__name__, 4000, Speed.FAST, Smart.HIGH, False
         )
+
+class PathPass(Enemy):
+    """Pass hunting along the map's distance fields, only in games played with pathfinding."""
+
+    def __init__(self, pos):
+        super().__init__(pos, "Pass", 4000, Speed.FAST, Smart.PATH, False)
@@ -5,7 +5,9 @@ import websockets
 import getpass
 import os
 
+from delta import DeltaDecoder
 from mapa import Map
+from protocol import loads
 
 # Next 2 lines are not needed for AI agent
 import pygame
@@ -13,13 +15,14 @@ import pygame
 pygame.init()
 
 
-async def agent_loop(server_address="localhost:8000", agent_name="student"):
+async def agent_loop(server_address="localhost:8000", agent_name="student", encoding=os.environ.get("ENCODING", "json")):
     async with websockets.connect(f"ws://{server_address}/player") as websocket:
 
         # Receive information about static game properties
-        await websocket.send(json.dumps({"cmd": "join", "name": agent_name}))
+        await websocket.send(json.dumps({"cmd": "join", "name": agent_name, "encoding": encoding}))
+        decoder = DeltaDecoder()  # full states out of delta frames, other messages pass through
         msg = await websocket.recv()
-        game_properties = json.loads(msg)
+        game_properties = decoder.apply(loads(msg))
 
         # You can create your own map representation or use the game representation:
         mapa = Map(size=game_properties["size"], mapa=game_properties["map"])
@@ -31,9 +34,9 @@ async def agent_loop(server_address="localhost:8000", agent_name="student"):
 
         while True:
             try:
-                state = json.loads(
+                state = decoder.apply(loads(
                     await websocket.recv()
-                )  # receive game state, this must be called timely or your game will get out of sync with the server
+                ))  # receive game state, this must be called timely or your game will get out of sync with the server
 
                 # Next lines are only for the Human Agent, the key values are nonetheless the correct ones!
                 key = ""
@@ -19,4 +19,5 @@ class Speed(IntEnum):
 class Smart(IntEnum):
     LOW = 1,
     NORMAL = 2,
-    HIGH = 3
\ No newline at end of file
+    HIGH = 3,
+    PATH = 4  # chases bomberman and flees bombs along the map's distance fields
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Delta encoded state frames.
+
+The server sends a full keyframe every KEYFRAME_INTERVAL ticks (and whenever
+the level changes) and only the differences to the previous state in
+between. All frames are plain JSON-able dictionaries:
+
+    {"frame": "key", "n": 12, "state": {...}}
+    {"frame": "delta", "n": 14, "base": 12, "set": {field: value}, "diff": {field: changes}}
+
+n numbers the frames and base is the frame a delta applies to, usually
+n - 1; DeltaDecoder refuses a delta whose base isn't the last frame it saw.
+
+For list fields, changes are {"del": [...], "add": [...]}: the removed items
+and the items appended at the end. Lists of dictionaries with an "id" (the
+enemies) are matched by id, "del" holds ids and "upd" the id and changed
+fields of each modified entry.
+Messages that are not frames (game info, final score) pass through
+DeltaDecoder.apply untouched, a snapshot (game info with the "state" of the
+last tick and its "n", sent to viewers joining mid game) also becomes the
+base the following delta frames apply to.
+"""
+KEYFRAME_INTERVAL = 50
+
+
+def freeze(value):
+    """Hashable, JSON equivalent version of value (tuples and lists are the same)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _keyed(items):
+    return bool(items) and all(isinstance(i, dict) and "id" in i for i in items)
+
+
+def diff_list(old, new):
+    """Changes turning list old into list new, None if they can't be expressed."""
+    if _keyed(old) or _keyed(new):
+        old_ids = {i["id"]: freeze(i) for i in old}
+        new_ids = [i["id"] for i in new]
+        kept = [i for i in old_ids if i in set(new_ids)]
+        if new_ids[: len(kept)] != kept:
+            return None  # reordered
+        changes = {
+            "del": [i for i in old_ids if i not in set(new_ids)],
+            "upd": [
+                {k: v for k, v in i.items() if k == "id" or (k, freeze(v)) not in old_ids[i["id"]]}
+                for i in new[: len(kept)]
+                if freeze(i) != old_ids[i["id"]]
+            ],
+            "add": new[len(kept) :],
+        }
+    else:
+        old_items = [freeze(i) for i in old]
+        new_items = [freeze(i) for i in new]
+        removed = set(old_items) - set(new_items)
+        kept = [i for i in old_items if i not in removed]
+        if new_items[: len(kept)] != kept or len(set(old_items)) != len(old_items):
+            return None  # reordered or duplicated items
+        changes = {"del": list(removed), "add": new[len(kept) :]}
+    return {k: v for k, v in changes.items() if v}
+
+
+def patch_list(old, changes):
+    if _keyed(old) or any(isinstance(i, dict) for i in changes.get("add", [])):
+        deleted = set(changes.get("del", []))
+        updated = {i["id"]: i for i in changes.get("upd", [])}
+        items = [dict(i, **updated.get(i["id"], {})) for i in old if i["id"] not in deleted]
+    else:
+        deleted = {freeze(i) for i in changes.get("del", [])}
+        items = [i for i in old if freeze(i) not in deleted]
+    return items + list(changes.get("add", []))
+
+
+def key_frame(state, n=None):
+    return {"frame": "key", "n": n, "state": state}
+
+
+def delta_frame(last, state, n=None, base=None):
+    """Delta frame turning state last (frame base) into state (frame n)."""
+    frame = {"frame": "delta", "n": n, "base": base, "set": {}, "diff": {}}
+    for field, value in state.items():
+        if field in last and freeze(last[field]) == freeze(value):
+            continue
+        if isinstance(value, list) and isinstance(last.get(field), list):
+            changes = diff_list(last[field], value)
+            if changes is not None and sum(map(len, changes.values())) < len(value):
+                frame["diff"][field] = changes
+                continue
+        frame["set"][field] = value
+    return frame
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """Next frame will be a keyframe."""
+        self._last = None
+        self._n = None
+        self._frames = 0
+
+    def keyframe(self):
+        """Keyframe of the last encoded state, for clients joining mid stream."""
+        return key_frame(self._last, self._n)
+
+    def encode(self, state, n=None):
+        """Frame n, a keyframe unless the previous state encoded was frame n - 1."""
+        if n is None:
+            n = 0 if self._n is None else self._n + 1
+        last, self._last = self._last, dict(state)
+        base, self._n = self._n, n
+
+        self._frames += 1
+        if (
+            last is None
+            or base != n - 1
+            or self._frames >= self.keyframe_interval
+            or last.get("level") != state.get("level")
+        ):
+            self._frames = 0
+            return self.keyframe()
+        return delta_frame(last, state, n, base)
+
+
+class DeltaDecoder:
+    def __init__(self):
+        self._state = None
+        self._n = None
+
+    def apply(self, message):
+        """Full state for a keyframe or delta frame, other messages are returned as is."""
+        frame = message.get("frame")
+        if frame == "key":
+            self._state = message["state"]
+            self._n = message.get("n")
+        elif frame == "delta":
+            if self._state is None:
+                raise ValueError("delta frame received before any keyframe")
+            if message.get("base") is not None and message["base"] != self._n:
+                raise ValueError(
+                    f"delta frame against frame {message['base']}, the last one was {self._n}"
+                )
+            state = dict(self._state)
+            state.update(message["set"])
+            for field, changes in message["diff"].items():
+                state[field] = patch_list(state[field], changes)
+            self._state = state
+            self._n = message.get("n")
+        else:
+            if "state" in message:
+                self._state = message["state"]  # snapshot
+                self._n = message.get("n")
+            return message
+        return dict(self._state)
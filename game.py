@@ -1,14 +1,16 @@
-import asyncio
 import json
 import logging
 import math
 import os
+import random
+import time
 
 import requests
 
-from characters import Balloom, Bomberman, Character, Doll, Minvo, Oneal, Kondoria, Ovapi, Pass, distance
+from characters import Balloom, Bomberman, Character, Doll, Minvo, Oneal, Kondoria, Ovapi, Pass, PathPass, distance, move_enemies
 from consts import Powerups
 from mapa import Map, Tiles, VITAL_SPACE
+from ticker import MAX_CATCH_UP, Ticker
 
 logger = logging.getLogger("Game")
 logger.setLevel(logging.DEBUG)
@@ -38,6 +40,12 @@ LEVEL_ENEMIES = {
     15: [Doll] * 1 + [Minvo] * 3 + [Kondoria] * 3 + [Pass] * 1,
 }
 
+# opt-in rules where Pass hunts along the map's distance fields, see Game(pathfinding=True)
+PATH_LEVEL_ENEMIES = {
+    level: [PathPass if enemy is Pass else enemy for enemy in enemies]
+    for level, enemies in LEVEL_ENEMIES.items()
+}
+
 LEVEL_POWERUPS = {
     1: Powerups.Flames,
     2: Powerups.Bombs,
@@ -64,6 +72,8 @@ class Bomb:
         self._radius = radius
         self._detonator = detonator
         self._map = mapa
+        self._blast = None  # cells reached by the explosion, see _compute_blast
+        self._blast_cells = None  # the same cells as a set, for in_range
 
     def detonate(self):
         if self._detonator:
@@ -88,54 +98,75 @@ class Bomb:
     def exploded(self):
         return not self._timeout > 0
 
-    def in_range(self, character):
+    def _compute_blast(self):
+        """Cells reached by the explosion, each ray stops at the first stone."""
         bx, by = self._pos
+        cells = [] if self._map.is_stone(self._pos) else [self._pos]
+        for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+            for r in range(1, self._radius + 1):
+                cell = (bx + dx * r, by + dy * r)
+                if self._map.is_stone(cell):
+                    break  # protected by stone
+                cells.append(cell)
+        self._blast = cells
+        self._blast_cells = set(cells)
+
+    @property
+    def blast(self):
+        if self._blast is None:
+            self._compute_blast()
+        return self._blast
+
+    def in_range(self, character):
         if isinstance(character, Character):
-            cx, cy = character.pos
+            pos = character.pos
         else:
-            cx, cy = character
-
-        if by == cy:
-            for r in range(self._radius + 1):
-                if self._map.is_stone((bx + r, by)):
-                    break  # protected by stone to the right
-                if (cx, cy) == (bx + r, by):
-                    return True
-            for r in range(self._radius + 1):
-                if self._map.is_stone((bx - r, by)):
-                    break  # protected by stone to the left 
-                if (cx, cy) == (bx - r, by):
-                    return True
-        if bx == cx:
-            for r in range(self._radius + 1):
-                if self._map.is_stone((bx, by + r)):
-                    break  # protected by stone in the bottom
-                if (cx, cy) == (bx, by + r):
-                    return True
-            for r in range(self._radius + 1):
-                if self._map.is_stone((bx, by - r)):
-                    break  # protected by stone in the top
-                if (cx, cy) == (bx, by - r):
-                    return True
-
-        return False
+            pos = tuple(character)
+
+        if self._blast_cells is None:
+            self._compute_blast()
+        return pos in self._blast_cells
 
     def __repr__(self):
         return self._pos
 
 
 class Game:
-    def __init__(self, level=1, lives=LIVES, timeout=TIMEOUT, size=MAP_SIZE):
+    def __init__(self, level=1, lives=LIVES, timeout=TIMEOUT, size=MAP_SIZE, map_class=Map, seed=None, map_pool=None, catch_up=MAX_CATCH_UP, pathfinding=False):
         logger.info(f"Game(level={level}, lives={lives})")
         self.initial_level = level
+        self.pathfinding = pathfinding
+        self._level_enemies = PATH_LEVEL_ENEMIES if pathfinding else LEVEL_ENEMIES
         self._running = False
         self._timeout = timeout
         self._score = 0
         self._step = 0
         self._total_steps = 0
         self._state = {}
+        self._encoded_state = None
+        self.state_encode_time = 0  # seconds spent encoding the last state
+        self.state_size = 0  # bytes of the last encoded state
+        self.step_time = 0  # seconds spent simulating the last tick
         self._initial_lives = lives
-        self.map = Map(size=size, empty=True)
+        self._map_class = map_class
+        if seed is None:
+            seed = random.getrandbits(32)  # always known, so the game can be replayed
+        self.seed = seed
+        self._rng = random.Random(seed)  # every game has its own generator
+        self._keys = []  # key applied on each tick, see replay.py
+        self._catch_up = catch_up
+        self.ticker = None  # paces next_frame(), created by start()
+        self.profiler = None  # set a profiler.Profiler to time the phases of every tick
+        self._phases = [
+            ("explode_bomb", self.explode_bomb),
+            ("update_bomberman", self.update_bomberman),
+            ("collision", self.collision),
+            ("update_enemies", self.update_enemies),
+            ("sanity_check", self.sanity_check),
+            ("build_state", self.build_state),
+        ]
+        self._map_pool = map_pool  # MapPool to take level maps from, same size and class
+        self.map = map_class(size=size, empty=True, rng=self._rng)
         self._enemies = []
 
     def info(self):
@@ -148,6 +179,13 @@ class Game:
             "score": self.score,
         }
 
+    def snapshot(self):
+        """info() with the map as it is now and the state of the last tick."""
+        snapshot = self.info()
+        if self._state:
+            snapshot["state"] = self._state
+        return snapshot
+
     @property
     def running(self):
         return self._running
@@ -160,8 +198,18 @@ class Game:
     def total_steps(self):
         return self._total_steps
 
-    def start(self, player_name):
+    @property
+    def keys(self):
+        """Keys applied on every tick since start(), "" when none was pressed."""
+        return self._keys
+
+    def start(self, player_name, seed=None):
         logger.debug("Reset world")
+        if seed is not None:
+            self.seed = seed
+        self._rng.seed(self.seed)
+        self._keys = []
+        self.ticker = Ticker(GAME_SPEED, self._catch_up)
         self._player_name = player_name
         self._running = True
         self._total_steps = 0
@@ -185,17 +233,27 @@ class Game:
             return
 
         logger.info("NEXT LEVEL")
-        self.map = Map(level=level, size=self.map.size, enemies=len(LEVEL_ENEMIES[level]))
+        seed = self._rng.getrandbits(32)  # each level map only depends on its own seed
+        if self._map_pool is not None:
+            self.map = self._map_pool.get(level, seed, len(LEVEL_ENEMIES[level]))
+        else:
+            self.map = self._map_class(
+                level=level,
+                size=self.map.size,
+                enemies=len(LEVEL_ENEMIES[level]),
+                rng=random.Random(seed),
+            )
         self._bomberman.respawn()
         self._total_steps += self._step
         self._step = 0
         self._bombs = []
+        self._explosions = []
         self._powerups = []
         self._bonus = []
         self._exit = []
         self._lastkeypress = ""
         self._enemies = [
-            t(p) for t, p in zip(LEVEL_ENEMIES[level], self.map.enemies_spawn)
+            t(p) for t, p in zip(self._level_enemies[level], self.map.enemies_spawn)
         ]
         logger.debug("Enemies: %s", [(e._name, e.pos) for e in self._enemies])
         logger.debug("Walls: %s", self.map.walls)
@@ -280,8 +338,9 @@ class Game:
                 if bomb.in_range(self._bomberman) and not self._bomberman.flamepass:
                     self.kill_bomberman()
 
-                for wall in self.map.walls[:]:
-                    if bomb.in_range(wall):
+                self._explosions.append(bomb.blast)
+                for wall in bomb.blast:
+                    if self.map.is_wall(wall):
                         logger.debug(f"Destroying wall @{wall}")
                         self.map.remove_wall(wall)
                         if self.map.exit_door == wall:
@@ -300,13 +359,18 @@ class Game:
                 if bomb in self._bombs:
                     self._bombs.remove(bomb)
 
-    async def next_frame(self):
-        await asyncio.sleep(1.0 / GAME_SPEED)
+    def step(self, key=None):
+        """Advance the game one tick, without any wall-clock pacing.
+
+        If key is given it is applied as if received through keypress().
+        Returns the new state dictionary."""
+        if key is not None:
+            self.keypress(key)
 
         if not self._running:
-            logger.info("Waiting for player 1")
-            return
+            return self._state
 
+        self._keys.append(self._lastkeypress)
         self._step += 1
         if self._step == self._timeout:
             self.stop()
@@ -316,20 +380,25 @@ class Game:
                 f"[{self._step}] SCORE {self._score} - LIVES {self._bomberman.lives}"
             )
 
-        self.explode_bomb()
-        self.update_bomberman()
-        self.collision()
+        self._explosions = []
+        if self.profiler is None:
+            for _, phase in self._phases:
+                phase()
+        else:
+            self.profiler.run(self.map.level, self._phases)
+        return self._state
 
+    def update_enemies(self):
         if (
             self._step % (self._bomberman.powers.count(Powerups.Speed) + 1) == 0
         ):  # increase speed of bomberman by moving enemies less often
-            for enemy in self._enemies:
-                enemy.move(self.map, self._bomberman, self._bombs, self._enemies)
+            move_enemies(self._enemies, self.map, self._bomberman, self._bombs)
             self.collision()
 
-        #sanity check
-        assert all([ep not in self.map.walls for ep in [e.pos for e in self._enemies if not e._wallpass]])
+    def sanity_check(self):
+        assert all([not self.map.is_wall(e.pos) for e in self._enemies if not e._wallpass])
 
+    def build_state(self):
         self._state = {
             "level": self.map.level,
             "step": self._step,
@@ -339,6 +408,7 @@ class Game:
             "lives": self._bomberman.lives,
             "bomberman": self._bomberman.pos,
             "bombs": [(b.pos, b.timeout, b.radius) for b in self._bombs],
+            "explosions": self._explosions,
             "enemies": [{"name": str(e), "id": str(e.id), "pos": e.pos} for e in self._enemies],
             "walls": self.map.walls,
             "powerups": [(p, Powerups(n).name) for p, n in self._powerups],
@@ -346,7 +416,28 @@ class Game:
             "exit": self._exit,
         }
 
+    async def next_frame(self):
+        """Step on the next tick of the fixed timestep clock."""
+        if self.ticker is None:
+            self.ticker = Ticker(GAME_SPEED, self._catch_up)
+        await self.ticker.wait()
+
+        if not self._running:
+            logger.info("Waiting for player 1")
+            return
+
+        start = time.perf_counter()
+        state = self.step()
+        self.step_time = time.perf_counter() - start
+        return state
+
     @property
     def state(self):
-        # logger.debug(self._state)
-        return json.dumps(self._state)
+        """JSON encoded state, encoded once per tick however many times it is read."""
+        if self._encoded_state is None or self._encoded_state[0] is not self._state:
+            start = time.perf_counter()
+            encoded = json.dumps(self._state)
+            self.state_encode_time = time.perf_counter() - start
+            self.state_size = len(encoded)
+            self._encoded_state = (self._state, encoded)
+        return self._encoded_state[1]
@@ -0,0 +1,106 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+
+from game import Game, LIVES, MAP_SIZE, TIMEOUT
+from profiler import Profiler
+
+logger = logging.getLogger("Headless")
+logger.setLevel(logging.INFO)
+
+
+def quiet():
+    """Log warnings only, the game loggers are chatty."""
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logging.disable(logging.INFO)
+
+
+def load_agent(path, directory=None):
+    """Resolve an agent factory given as "module:attribute".
+
+    Modules not found on sys.path are looked up in directory, by default the
+    one the runner is started from. sys.path is restored afterwards."""
+    module_name, _, attr = path.partition(":")
+    directory = os.path.abspath(directory or os.getcwd())
+    added = directory not in sys.path  # the only match is ours then
+    if added:
+        sys.path.append(directory)
+    try:
+        module = importlib.import_module(module_name)
+    finally:
+        if added:
+            sys.path.remove(directory)
+    return getattr(module, attr or "Agent")
+
+
+def play(
+    agent_factory,
+    player="agent",
+    level=1,
+    lives=LIVES,
+    timeout=TIMEOUT,
+    size=MAP_SIZE,
+    seed=None,
+    map_pool=None,
+    profiler=None,
+):
+    """Play a whole game in-process, as fast as the CPU allows.
+
+    agent_factory is called once with the game info (the same dictionary a
+    client receives when it joins) and must return a callable that takes a
+    state dictionary and returns the key to press ("" for none).
+    Games with the same seed are played on the same maps, a profiler.Profiler
+    times the phases of every tick.
+    Returns a game record in the format used by the grading server."""
+    game = Game(level, lives, timeout, size, seed=seed, map_pool=map_pool)
+    game.profiler = profiler
+    game.start(player)
+    agent = agent_factory(game.info())
+
+    state = game.step()
+    while game.running:
+        state = game.step(agent(state) or "")
+
+    return {
+        "player": player,
+        "score": game.score,
+        "total_steps": game.total_steps,
+        "level": game.map.level,
+    }
+
+
+if __name__ == "__main__":
+    quiet()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("agent", help="agent factory as module:attribute")
+    parser.add_argument("--name", help="player name", default="agent")
+    parser.add_argument("--level", help="start on level", type=int, default=1)
+    parser.add_argument("--lives", help="Number of lives", type=int, default=LIVES)
+    parser.add_argument("--seed", help="Seed number", type=int, default=0)
+    parser.add_argument(
+        "--timeout", help="Timeout after this amount of steps", type=int, default=TIMEOUT
+    )
+    parser.add_argument(
+        "--profile", help="time the phases of every tick, folded stacks are written to this file"
+    )
+    args = parser.parse_args()
+
+    profiler = Profiler() if args.profile else None
+    result = play(
+        load_agent(args.agent),
+        player=args.name,
+        level=args.level,
+        lives=args.lives,
+        timeout=args.timeout,
+        seed=args.seed or None,
+        profiler=profiler,
+    )
+    print(json.dumps(result))
+    if profiler:
+        print(profiler.report(), file=sys.stderr)
+        with open(args.profile, "w") as outfile:
+            outfile.write(profiler.folded())
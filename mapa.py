@@ -1,6 +1,7 @@
 import os
 import logging
 import random
+from collections import OrderedDict, deque
 from enum import IntEnum
 
 logger = logging.getLogger("Map")
@@ -14,19 +15,88 @@ class Tiles(IntEnum):
 
 
 VITAL_SPACE = 3
+DISTANCE_FIELDS = 8  # distance fields cached per map
+POOL_SIZE = 256  # maps kept by a MapPool
+
+
+class DistanceField:
+    """Number of steps from the nearest source to every reachable tile.
+
+    Built with one BFS over the map, walls block the way unless wallpass.
+    Use Map.distance_field() to get a field shared by everyone in the tick."""
+
+    def __init__(self, mapa, sources, wallpass=False):
+        self._map = mapa
+        self.sources = tuple(tuple(s) for s in sources)
+        self.wallpass = wallpass
+        self._dist = {s: 0 for s in self.sources}
+        self._expand(deque(self.sources))
+
+    def _neighbours(self, pos):
+        x, y = pos
+        for npos in [(x, y - 1), (x - 1, y), (x, y + 1), (x + 1, y)]:
+            if not self._map.is_blocked(npos, self.wallpass):
+                yield npos
+
+    def _expand(self, queue):
+        dist = self._dist
+        while queue:
+            pos = queue.popleft()
+            d = dist[pos] + 1
+            for npos in self._neighbours(pos):
+                if dist.get(npos, d + 1) > d:
+                    dist[npos] = d
+                    queue.append(npos)
+
+    def wall_removed(self, wall):
+        """Update the field after wall became a passage, distances can only shrink."""
+        if self.wallpass:
+            return  # walls were never in the way
+        known = [self._dist[n] for n in self._neighbours(wall) if n in self._dist]
+        if known and self._dist.get(wall, min(known) + 2) > min(known) + 1:
+            self._dist[wall] = min(known) + 1
+            self._expand(deque([wall]))
+
+    def get(self, pos, default=None):
+        """Steps from pos to the nearest source, default if unreachable."""
+        return self._dist.get(tuple(pos), default)
+
+    def __getitem__(self, pos):
+        return self._dist[tuple(pos)]
+
+    def __contains__(self, pos):
+        return tuple(pos) in self._dist
+
+    def path(self, pos):
+        """Shortest path from pos to the nearest source, [] if unreachable."""
+        pos = tuple(pos)
+        if pos not in self._dist:
+            return []
+        path = [pos]
+        while self._dist[pos]:
+            pos = min(
+                (n for n in self._neighbours(pos) if n in self._dist),
+                key=self._dist.get,
+            )
+            path.append(pos)
+        return path
 
 
 class Map:
-    def __init__(self, level=1, enemies=0, size=(VITAL_SPACE+10, VITAL_SPACE+10), mapa=None, enemies_spawn=None, empty=False):
+    def __init__(self, level=1, enemies=0, size=(VITAL_SPACE+10, VITAL_SPACE+10), mapa=None, enemies_spawn=None, empty=False, rng=None):
 
         assert size[0] > VITAL_SPACE+9
         assert size[1] > VITAL_SPACE+9
 
+        if rng is None:
+            rng = random  # module level generator, pass a random.Random for reproducible maps
         self._level = level
         self._size = size
         self.hor_tiles = size[0]
         self.ver_tiles = size[1]
-        self._walls = []
+        self._walls = {}  # ordered set of wall positions, mirrored in self.map
+        self._fields = {}
+        self._shared = False  # tiles shared with a copy, see copy()
         if enemies_spawn:
             self._enemies_spawn = enemies_spawn
         else:
@@ -44,9 +114,9 @@ class Map:
                     elif (
                         x >= VITAL_SPACE and y >= VITAL_SPACE and not empty
                     ):  # give bomberman some room
-                        if random.randint(0, 100) > 70 + 25 / level:
+                        if rng.randint(0, 100) > 70 + 25 / level:
                             self.map[x][y] = Tiles.WALL
-                            self._walls.append((x, y))
+                            self._walls[(x, y)] = None
 
             for _ in range(enemies):
                 x, y = 0, 0
@@ -55,8 +125,8 @@ class Map:
                     Tiles.WALL,
                 ]:  # find empty spots to place enemies
                     x, y = (
-                        random.randrange(VITAL_SPACE, self.hor_tiles),
-                        random.randrange(VITAL_SPACE, self.ver_tiles),
+                        rng.randrange(VITAL_SPACE, self.hor_tiles),
+                        rng.randrange(VITAL_SPACE, self.ver_tiles),
                     )
                 self._enemies_spawn.append((x, y))
                 logger.debug(f"Spawn enemy at ({x}, {y})")
@@ -64,21 +134,23 @@ class Map:
                 for rx, ry in [(x, y) for x in [-1, 0, 1] for y in [-1, 0, 1]]:
                     if self.map[x + rx][y + ry] in [Tiles.WALL]:
                         self.map[x + rx][y + ry] = Tiles.PASSAGE
-                        self._walls.remove((x + rx, y + ry))
+                        del self._walls[(x + rx, y + ry)]
 
             if not empty:
-                self.exit_door = random.choice(self._walls)
-                self.powerup = random.choice(
-                    [w for w in self._walls if w != self.exit_door]
+                walls = self.walls
+                self.exit_door = rng.choice(walls)
+                self.powerup = rng.choice(
+                    [w for w in walls if w != self.exit_door]
                 )  # hide powerups behind walls only
 
         else:
             logger.info("Loading MAP")
-            self.map = mapa
+            self.map = [list(column) for column in mapa]
+            self.map[1][1] = Tiles.PASSAGE  # bomberman spawn is never a wall
             for x in range(self.hor_tiles):
                 for y in range(self.ver_tiles):
-                    if self.map[x][y] == Tiles.WALL and (x, y) != (1, 1):
-                        self._walls.append((x, y))
+                    if self.map[x][y] == Tiles.WALL:
+                        self._walls[(x, y)] = None
         self._bomberman_spawn = (1, 1)  # Always true
 
     def __getstate__(self):
@@ -91,16 +163,52 @@ class Map:
     def size(self):
         return self._size
 
+    def copy(self):
+        """Copy sharing the tiles with this map until either of them changes."""
+        other = object.__new__(type(self))  # not copy.copy, __getstate__ only keeps the tiles
+        other.__dict__.update(self.__dict__)
+        other._enemies_spawn = list(self._enemies_spawn)
+        other._fields = {}
+        other._shared = self._shared = True
+        return other
+
+    def _unshare(self):
+        if self._shared:
+            self.map = [list(column) for column in self.map]
+            self._walls = dict(self._walls)
+            self._shared = False
+
     @property
     def walls(self):
-        return self._walls
+        return list(self._walls)
 
     @walls.setter
     def walls(self, walls):
-        self._walls = [ (x, y) for x, y in walls ] 
+        self._unshare()
+        for x, y in self._walls:
+            self.map[x][y] = Tiles.PASSAGE
+        self._walls = {}
+        for x, y in walls:
+            self.map[x][y] = Tiles.WALL
+            self._walls[(x, y)] = None
+        self._fields = {}
 
     def remove_wall(self, wall):
-        self._walls.remove(wall)
+        self._unshare()
+        del self._walls[wall]
+        x, y = wall
+        self.map[x][y] = Tiles.PASSAGE
+        for field in self._fields.values():
+            field.wall_removed(wall)
+
+    def distance_field(self, sources, wallpass=False):
+        """DistanceField from sources, computed once and kept up to date as walls fall."""
+        key = (tuple(tuple(s) for s in sources), wallpass)
+        if key not in self._fields:
+            if len(self._fields) >= DISTANCE_FIELDS:
+                del self._fields[next(iter(self._fields))]  # drop the oldest
+            self._fields[key] = DistanceField(self, key[0], wallpass)
+        return self._fields[key]
 
     @property
     def level(self):
@@ -124,17 +232,24 @@ class Map:
 
     def is_blocked(self, pos, wallpass=False):
         x, y = pos
-        if x not in range(self.hor_tiles) or y not in range(self.ver_tiles):
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles):
             return True
-        if self.map[x][y] in [Tiles.STONE] or (not wallpass and (x, y) in self._walls):
+        tile = self.map[x][y]
+        if tile == Tiles.STONE or (not wallpass and tile == Tiles.WALL):
             return True
         return False
 
     def is_stone(self, pos):
         x, y = pos
-        if x >= self.hor_tiles or y >= self.ver_tiles: #everything outside of map is stone
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles): #everything outside of map is stone
             return True
-        return self.map[x][y] in [Tiles.STONE]
+        return self.map[x][y] == Tiles.STONE
+
+    def is_wall(self, pos):
+        x, y = pos
+        if not (0 <= x < self.hor_tiles and 0 <= y < self.ver_tiles):
+            return False
+        return self.map[x][y] == Tiles.WALL
 
     def calc_pos(self, cur, direction, wallpass=False):
         assert direction in "wasd" or direction == ""
@@ -155,3 +270,43 @@ class Map:
             return cur
 
         return npos
+
+
+class MapPool:
+    """LRU pool of generated maps keyed by (level, seed, enemies).
+
+    Maps generated from the same key are identical, get() hands out
+    copy-on-write copies so the pooled map is never modified."""
+
+    def __init__(self, size=(VITAL_SPACE+10, VITAL_SPACE+10), map_class=Map, capacity=POOL_SIZE):
+        self.size = size
+        self.map_class = map_class
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._maps = OrderedDict()
+
+    def __len__(self):
+        return len(self._maps)
+
+    def __contains__(self, key):
+        return key in self._maps
+
+    def _generate(self, level, seed, enemies):
+        return self.map_class(
+            level=level, size=self.size, enemies=enemies, rng=random.Random(seed)
+        )
+
+    def get(self, level, seed, enemies=0):
+        key = (level, seed, enemies)
+        mapa = self._maps.get(key)
+        if mapa is not None:
+            self.hits += 1
+            self._maps.move_to_end(key)
+            return mapa.copy()
+        self.misses += 1
+        mapa = self._generate(*key)
+        self._maps[key] = mapa
+        while len(self._maps) > self.capacity:
+            self._maps.popitem(last=False)
+        return mapa.copy()
@@ -0,0 +1,161 @@
+"""Metrics in the Prometheus text exposition format.
+
+A Registry holds counters, gauges and histograms, optionally with labels,
+and serve() exposes them over HTTP from the running event loop:
+
+    registry = Registry()
+    sent = registry.counter("sent_bytes_total", "Bytes sent", ["role"])
+    sent.inc(120, role="player")
+    await serve(registry, "127.0.0.1", 9100)
+"""
+import bisect
+import logging
+
+from aiohttp import web
+
+logger = logging.getLogger("Metrics")
+logger.setLevel(logging.INFO)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BYTES = tuple(4 ** n * 1024 for n in range(10))  # 1KiB to 256MiB
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) of every sample."""
+        if not self._values and not self.labels:
+            return [("", (), (), 0)]
+        return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labels, key, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function  # called on every scrape, for unlabelled gauges
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [("", (), (), self.function())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = [[0] * len(self.buckets), 0, 0.0]  # counts, count, sum
+        counts, _, _ = data = self._values[key]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(counts):
+            counts[i] += 1
+        data[1] += 1
+        data[2] += value
+
+    def samples(self):
+        samples = []
+        for key, (counts, count, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                samples.append(("_bucket", key, [("le", _number(float(bound)))], cumulative))
+            samples.append(("_bucket", key, [("le", "+Inf")], count))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._add(Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=SECONDS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def expose(self):
+        return "\n".join(m.expose() for m in self._metrics.values()) + "\n"
+
+
+async def serve(registry, host="127.0.0.1", port=9100):
+    """Serve the registry on http://host:port/metrics, returns the aiohttp runner."""
+
+    async def metrics(request):
+        return web.Response(body=registry.expose(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics @ http://{host}:{port}/metrics")
+    return runner
@@ -1,3 +1,6 @@
-from grading import db
+from grading import db, Game, rebuild_leaderboard
 
 db.create_all()
+for index in Game.__table__.indexes:  # create_all leaves existing tables alone
+    index.create(db.engine, checkfirst=True)
+rebuild_leaderboard()
@@ -1,12 +1,17 @@
 from flask import Flask, request, jsonify, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
+from marshmallow import fields
+from datetime import datetime
+import hashlib
 import os
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, tuple_
 
 app = Flask(__name__, static_url_path='')
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'grades.sqlite')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'GRADING_DB', 'sqlite:///' + os.path.join(basedir, 'grades.sqlite')
+)
 db = SQLAlchemy(app)
 ma = Marshmallow(app)
 
@@ -14,9 +19,9 @@ ma = Marshmallow(app)
 class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, server_default=db.func.now())
-    player = db.Column(db.String(25))
+    player = db.Column(db.String(25), index=True)
     level = db.Column(db.Integer)
-    score = db.Column(db.Integer)
+    score = db.Column(db.Integer, index=True)
     total_steps = db.Column(db.Integer)
 
     def __init__(self, player, level, score, total_steps):
@@ -25,55 +30,154 @@ class Game(db.Model):
         self.score = score
         self.total_steps = total_steps
 
+
+# best game of every player, kept up to date as games are added
+class Leaderboard(db.Model):
+    player = db.Column(db.String(25), primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), index=True)
+    timestamp = db.Column(db.DateTime)
+    level = db.Column(db.Integer)
+    score = db.Column(db.Integer)
+    total_steps = db.Column(db.Integer)
+
+    __table_args__ = (db.Index('ix_leaderboard_rank', 'score', 'timestamp'),)
+
+    def __init__(self, game):
+        self.player = game.player
+        self.update(game)
+
+    def update(self, game):
+        self.game_id = game.id
+        self.timestamp = game.timestamp
+        self.level = game.level
+        self.score = game.score
+        self.total_steps = game.total_steps
+
 class GameSchema(ma.Schema):
     class Meta:
         # Fields to expose
         fields = ('id', 'timestamp', 'player', 'level', 'score', 'total_steps')
 
 
+class LeaderboardSchema(ma.Schema):
+    id = fields.Integer(attribute='game_id')
+
+    class Meta:
+        # Same fields as a game
+        fields = ('id', 'timestamp', 'player', 'level', 'score', 'total_steps')
+
+
 game_schema = GameSchema()
 games_schema = GameSchema(many=True)
+leaderboard_schema = LeaderboardSchema(many=True)
 
 
-# endpoint to create new game
-@app.route("/game", methods=["POST"])
-def add_game():
-    player = request.json['player']
-    level = request.json['level']
-    score = request.json['score']
-    total_steps= request.json.get('total_steps', -1)
+def update_leaderboard(game):
+    best = Leaderboard.query.get(game.player)
+    if best is None:
+        db.session.add(Leaderboard(game))
+    elif game.score > best.score:
+        best.update(game)
 
-    print(player, score)
-    new_game = Game(player, level, score, total_steps)
 
-    db.session.add(new_game)
+def rebuild_leaderboard():
+    """Fill the leaderboard from the games, for databases created before it."""
+    Leaderboard.query.delete()
+    best = db.session.query(Game.player, func.max(Game.score).label('score')).group_by(Game.player).subquery()
+    first_best = db.session.query(func.min(Game.id)).join(best, and_(Game.player == best.c.player, Game.score == best.c.score)).group_by(Game.player)
+    for game_id, in first_best:
+        db.session.add(Leaderboard(Game.query.get(game_id)))
     db.session.commit()
 
-    return game_schema.jsonify(new_game)
+
+def conditional(etag, result):
+    """JSON of result(), or 304 Not Modified when the client has it already.
+
+    Browsers revalidate on every request (no-cache) so polling pages only get
+    the data when it changed."""
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(result())
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+# endpoint to create new game, or several when given a list (see spool.py)
+@app.route("/game", methods=["POST"])
+def add_game():
+    games = request.json if isinstance(request.json, list) else [request.json]
+
+    new_games = []
+    for game in games:
+        try:
+            player = game['player']
+            level = game['level']
+            score = game['score']
+        except (KeyError, TypeError):
+            return jsonify(error="player, level and score expected"), 400  # not worth a retry
+        total_steps= game.get('total_steps', -1)
+
+        print(player, score)
+        new_games.append(Game(player, level, score, total_steps))
+
+    db.session.add_all(new_games)
+    db.session.flush()  # ids for the leaderboard
+    for new_game in new_games:
+        update_leaderboard(new_game)
+    db.session.commit()
+
+    if isinstance(request.json, list):
+        return games_schema.jsonify(new_games)
+    return game_schema.jsonify(new_games[0])
 
 @app.route("/static/<path:path>")
 def send_static(path):
     return send_from_directory('static', path)
 
-# endpoint to show highscores 
-@app.route("/highscores", methods=["GET"])
-def get_game():
-    page = request.args.get('page', 1, type=int)
+PAGE_SIZE = 20
 
-    q = db.session.query(Game.id, Game.timestamp, Game.player, Game.level, func.max(Game.score).label('score'), Game.total_steps).group_by(Game.player).order_by(Game.score.desc(), Game.timestamp.desc())
-#    print(q.statement)
 
-    all_games = q.paginate(page, 20, False)
-    result = games_schema.dump(all_games.items)
-    return jsonify(result)
+# endpoint to show highscores, the best game of each player
+# pages follow the score, timestamp and player of the last entry of the one before
+@app.route("/highscores", methods=["GET"])
+def get_game():
+    after = None
+    if 'player' in request.args:
+        try:
+            after = (
+                int(request.args['score']),
+                datetime.fromisoformat(request.args['timestamp']),
+                request.args['player'],
+            )
+        except (KeyError, ValueError):
+            return jsonify(error="score, timestamp and player of the last entry expected"), 400
+
+    # every change to the leaderboard points it to a game newer than all others
+    version = db.session.query(func.max(Leaderboard.game_id)).scalar()
+
+    def result():
+        rank = (Leaderboard.score, Leaderboard.timestamp, Leaderboard.player)
+        q = Leaderboard.query.order_by(*(column.desc() for column in rank))
+        if after:
+            q = q.filter(tuple_(*rank) < tuple_(*after))  # no OFFSET, the rank index seeks
+        return leaderboard_schema.dump(q.limit(PAGE_SIZE))
+
+    page = hashlib.sha1(repr(after).encode()).hexdigest()[:12] if after else "first"
+    return conditional(f"{version}-{page}", result)
 
 
 # endpoint to show player games
 @app.route("/highscores/<player>", methods=["GET"])
 def game_detail(player):
-    game = db.session.query(Game).filter(and_(Game.player == player, Game.score > 0)).order_by(Game.score.desc()).limit(10)
-    result = games_schema.dump(game)
-    return jsonify(result)
+    version = db.session.query(func.max(Game.id)).filter(Game.player == player).scalar()
+
+    def result():
+        game = db.session.query(Game).filter(and_(Game.player == player, Game.score > 0)).order_by(Game.score.desc()).limit(10)
+        return games_schema.dump(game)
+
+    return conditional(f"{version}", result)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+"""Opt-in timing of the phases of every game tick.
+
+    game.profiler = Profiler()
+    ...play...
+    print(game.profiler.report())
+    open("game.folded", "w").write(game.profiler.folded())
+
+Every phase of Game.step() is timed on each tick and kept in a histogram
+per level and phase. report() summarises them in a table, folded() writes
+them as folded stacks ("game;level 12;update_enemies 81234", microseconds)
+for flamegraph.pl or speedscope.
+"""
+import math
+import time
+
+BUCKETS = 24  # powers of two of microseconds, the last one is everything above 8s
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.counts[min(BUCKETS - 1, max(0, math.ceil(math.log2(us))) if us > 1 else 0)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Upper bound, in seconds, of the bucket holding the p-th percentile."""
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = {}  # (level, phase) -> Histogram
+
+    def run(self, level, phases):
+        """Run the (name, function) phases of a tick, timing each of them."""
+        clock = self.clock
+        for name, phase in phases:
+            start = clock()
+            phase()
+            self.add(level, name, clock() - start)
+
+    def add(self, level, phase, seconds):
+        key = (level, phase)
+        if key not in self.phases:
+            self.phases[key] = Histogram()
+        self.phases[key].add(seconds)
+
+    def report(self):
+        """Table of every level and phase, slowest phases first in each level."""
+        lines = [
+            f"{'level':>5} {'phase':18} {'ticks':>6} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9} {'share':>6}"
+        ]
+        for level in sorted({level for level, _ in self.phases}):
+            phases = [(p, h) for (l, p), h in self.phases.items() if l == level]
+            level_total = sum(h.total for _, h in phases) or 1
+            for phase, h in sorted(phases, key=lambda ph: -ph[1].total):
+                lines.append(
+                    f"{level:5d} {phase:18} {h.count:6d}"
+                    f" {h.mean * 1e6:7.1f}us {h.percentile(50) * 1e6:7.0f}us"
+                    f" {h.percentile(99) * 1e6:7.0f}us {h.max * 1e6:7.0f}us"
+                    f" {100 * h.total / level_total:5.1f}%"
+                )
+        return "\n".join(lines)
+
+    def folded(self):
+        """Folded stacks, one line per level and phase, weighted in microseconds."""
+        return "".join(
+            f"game;level {level};{phase} {round(h.total * 1e6)}\n"
+            for (level, phase), h in sorted(self.phases.items())
+        )
@@ -0,0 +1,209 @@
+"""Compact binary encoding of the game info and state messages.
+
+Clients ask for it joining with {"cmd": "join", "encoding": "binary"}, the
+server then sends game info and states as binary websocket messages, all
+other messages (final score, sessions) stay JSON text. loads() decodes both.
+Viewers joining a running game get a snapshot instead of the info: the
+info message immediately followed by the state message of the last tick.
+
+All integers are little endian, positions are one byte per coordinate, enemy
+ids are small integers assigned in order of appearance, enemy and powerup
+names are sent as codes. Values that don't fit their field (a map wider than
+255 tiles, level or lives above 255) raise ValueError, they are never
+truncated.
+"""
+import json
+import struct
+
+from consts import Powerups
+
+INFO, STATE, SNAPSHOT = 0, 1, 2
+ENCODINGS = ("json", "delta", "binary")
+ENEMY_NAMES = ("Balloom", "Oneal", "Doll", "Minvo", "Kondoria", "Ovapi", "Pass")
+
+INFO_HEADER = struct.Struct("<BBBBIBiI")  # type, width, height, fps, timeout, lives, score, session
+STATE_HEADER = struct.Struct("<BBIIiB")  # type, level, step, timeout, score, lives
+POS = struct.Struct("<BB")
+BOMB = struct.Struct("<BBHB")  # x, y, timeout in half ticks, radius
+ENEMY = struct.Struct("<HBBB")  # id, name, x, y
+POWERUP = struct.Struct("<BBB")  # x, y, powerup
+COUNT = struct.Struct("<H")
+SCORE = struct.Struct("<i")
+
+
+def _byte(value, name):
+    if not 0 <= value <= 255:
+        raise ValueError(f"{name} {value} does not fit in a byte")
+    return value
+
+
+def _pack_str(value):
+    data = value.encode("utf-8")
+    return COUNT.pack(len(data)) + data
+
+
+def _pack_positions(positions):
+    return COUNT.pack(len(positions)) + b"".join(POS.pack(*p) for p in positions)
+
+
+class BinaryEncoder:
+    """Encoder for the messages of one game, it numbers the enemies it sees."""
+
+    def __init__(self):
+        self._ids = {}
+
+    def enemy_id(self, uuid):
+        if uuid not in self._ids:
+            self._ids[uuid] = len(self._ids)
+        return self._ids[uuid]
+
+    def encode_info(self, info):
+        width, height = info["size"]
+        data = [
+            INFO_HEADER.pack(
+                INFO,
+                _byte(width, "map width"),
+                _byte(height, "map height"),
+                _byte(info["fps"], "fps"),
+                info["timeout"],
+                _byte(info["lives"], "lives"),
+                info["score"],
+                info.get("session", 0),
+            ),
+            b"".join(bytes(column) for column in info["map"]),
+            COUNT.pack(len(info.get("highscores", []))),
+        ]
+        for name, score in info.get("highscores", []):
+            data.append(_pack_str(name) + SCORE.pack(score))
+        return b"".join(data)
+
+    def encode_state(self, state):
+        try:
+            return self._encode_state(state)
+        except struct.error as e:  # a position or count out of range
+            raise ValueError(f"state does not fit the binary encoding: {e}") from e
+
+    def _encode_state(self, state):
+        data = [
+            STATE_HEADER.pack(
+                STATE,
+                _byte(state["level"], "level"),
+                state["step"],
+                state["timeout"],
+                state["score"],
+                _byte(state["lives"], "lives"),
+            ),
+            _pack_str(state["player"]),
+            POS.pack(*state["bomberman"]),
+            COUNT.pack(len(state["bombs"])),
+        ]
+        data += [BOMB.pack(*pos, int(timeout * 2), radius) for pos, timeout, radius in state["bombs"]]
+        data.append(COUNT.pack(len(state["explosions"])))
+        data += [_pack_positions(cells) for cells in state["explosions"]]
+        data.append(COUNT.pack(len(state["enemies"])))
+        data += [
+            ENEMY.pack(self.enemy_id(e["id"]), ENEMY_NAMES.index(e["name"]), *e["pos"])
+            for e in state["enemies"]
+        ]
+        data.append(_pack_positions(state["walls"]))
+        data.append(COUNT.pack(len(state["powerups"])))
+        data += [POWERUP.pack(*pos, Powerups[name]) for pos, name in state["powerups"]]
+        data.append(_pack_positions(state["bonus"]))
+        data.append(_pack_positions([state["exit"]] if state["exit"] else []))
+        return b"".join(data)
+
+    def encode_snapshot(self, snapshot):
+        data = bytes([SNAPSHOT]) + self.encode_info(snapshot)
+        if "state" in snapshot:
+            data += self.encode_state(snapshot["state"])
+        return data
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def count(self):
+        return self.unpack(COUNT)[0]
+
+    def bytes(self, n):
+        value = self.data[self.offset : self.offset + n]
+        self.offset += n
+        return value
+
+    def str(self):
+        return str(self.bytes(self.count()), "utf-8")
+
+    def positions(self):
+        return [list(self.unpack(POS)) for _ in range(self.count())]
+
+
+def _decode_info(reader):
+    _, width, height, fps, timeout, lives, score, session = reader.unpack(INFO_HEADER)
+    tiles = reader.bytes(width * height)
+    info = {
+        "size": [width, height],
+        "map": [list(tiles[x * height : (x + 1) * height]) for x in range(width)],
+        "fps": fps,
+        "timeout": timeout,
+        "lives": lives,
+        "score": score,
+        "highscores": [[reader.str(), reader.unpack(SCORE)[0]] for _ in range(reader.count())],
+    }
+    if session:
+        info["session"] = session
+    return info
+
+
+def _decode_state(reader):
+    _, level, step, timeout, score, lives = reader.unpack(STATE_HEADER)
+    state = {
+        "level": level,
+        "step": step,
+        "timeout": timeout,
+        "player": reader.str(),
+        "score": score,
+        "lives": lives,
+        "bomberman": list(reader.unpack(POS)),
+    }
+    bombs = [reader.unpack(BOMB) for _ in range(reader.count())]
+    state["bombs"] = [[[x, y], timeout / 2, radius] for x, y, timeout, radius in bombs]
+    state["explosions"] = [reader.positions() for _ in range(reader.count())]
+    enemies = [reader.unpack(ENEMY) for _ in range(reader.count())]
+    state["enemies"] = [
+        {"name": ENEMY_NAMES[name], "id": i, "pos": [x, y]} for i, name, x, y in enemies
+    ]
+    state["walls"] = reader.positions()
+    powerups = [reader.unpack(POWERUP) for _ in range(reader.count())]
+    state["powerups"] = [[[x, y], Powerups(p).name] for x, y, p in powerups]
+    state["bonus"] = reader.positions()
+    exit = reader.positions()
+    state["exit"] = exit[0] if exit else []
+    return state
+
+
+def decode(data):
+    """Game info, snapshot or state dictionary, as the JSON message would have been decoded."""
+    reader = _Reader(data)
+    if data[0] == SNAPSHOT:
+        reader.offset = 1
+        snapshot = _decode_info(reader)
+        if reader.offset < len(data):
+            snapshot["state"] = _decode_state(reader)
+        return snapshot
+    if data[0] == INFO:
+        return _decode_info(reader)
+    return _decode_state(reader)
+
+
+def loads(message):
+    """Decode a message received from the server, binary or JSON."""
+    if isinstance(message, (bytes, bytearray)):
+        return decode(message)
+    return json.loads(message)
@@ -0,0 +1,207 @@
+"""Render games offscreen, as fast as they can be drawn.
+
+Frames are drawn by the viewer's Scene on pygame's dummy video driver, from
+a replay (see replay.py), a state stream (JSON lines: the game info then one
+state per line, as a viewer receives them) or a live game. They are written
+as a PNG sequence to a directory, an animated GIF (requires
+`pip install pillow`) or, for any other extension, a video encoded by ffmpeg.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # no window
+
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+
+import pygame
+
+import replay
+import viewer
+from headless import quiet
+
+logger = logging.getLogger("Render")
+logger.setLevel(logging.INFO)
+
+
+class Renderer:
+    """Draws the states of one game on an offscreen surface."""
+
+    def __init__(self, info):
+        pygame.display.init()
+        pygame.font.init()
+        if viewer.SPRITES is None:
+            pygame.display.set_mode((1, 1))  # convert_alpha needs a video mode
+            viewer.SPRITES = pygame.image.load("data/nes.png").convert_alpha()
+        info = dict(info, highscores=info.get("highscores", []))
+        self.surface = pygame.Surface(viewer.scale(info["size"]))
+        self.scene = viewer.Scene(self.surface, info)
+        self.scene.draw()
+
+    def frame(self, state):
+        self.scene.update(state)
+        self.scene.draw()
+        return self.surface
+
+
+class PNGWriter:
+    def __init__(self, directory, fps):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.frames = 0
+
+    def write(self, surface):
+        self.frames += 1
+        pygame.image.save(surface, os.path.join(self.directory, f"{self.frames:05d}.png"))
+
+    def close(self):
+        pass
+
+
+class GIFWriter:
+    def __init__(self, filename, fps):
+        from PIL import Image  # optional dependency
+
+        self._image = Image
+        self.filename = filename
+        self.duration = 1000 / fps
+        self.frames = []
+
+    def write(self, surface):
+        image = self._image.frombytes(
+            "RGB", surface.get_size(), pygame.image.tobytes(surface, "RGB")
+        )
+        self.frames.append(image.quantize())  # one byte per pixel while waiting
+
+    def close(self):
+        if self.frames:
+            self.frames[0].save(
+                self.filename,
+                save_all=True,
+                append_images=self.frames[1:],
+                duration=self.duration,
+                loop=0,
+            )
+
+
+class VideoWriter:
+    def __init__(self, filename, fps):
+        self.filename = filename
+        self.fps = fps
+        self._ffmpeg = None
+
+    def write(self, surface):
+        if self._ffmpeg is None:
+            width, height = surface.get_size()
+            self._ffmpeg = subprocess.Popen(
+                [
+                    "ffmpeg", "-y", "-loglevel", "error",
+                    "-f", "rawvideo", "-pix_fmt", "rgb24",
+                    "-s", f"{width}x{height}", "-r", str(self.fps),
+                    "-i", "-",
+                    "-pix_fmt", "yuv420p", self.filename,
+                ],
+                stdin=subprocess.PIPE,
+            )
+        self._ffmpeg.stdin.write(pygame.image.tobytes(surface, "RGB"))
+
+    def close(self):
+        if self._ffmpeg is not None:
+            self._ffmpeg.stdin.close()
+            self._ffmpeg.wait()
+
+
+def writer(output, fps):
+    """Writer for output, chosen by its extension."""
+    extension = os.path.splitext(output)[1].lower()
+    if not extension:
+        return PNGWriter(output, fps)
+    if extension == ".gif":
+        return GIFWriter(output, fps)
+    return VideoWriter(output, fps)
+
+
+def render(info, states, output, every=1):
+    """Draw every state and write one frame out of every, returns the frames written."""
+    out = writer(output, max(1, info["fps"] // every))
+    renderer = Renderer(info)
+    frames = 0
+    try:
+        for i, state in enumerate(states):
+            surface = renderer.frame(state)
+            if i % every == 0:
+                out.write(surface)
+                frames += 1
+    finally:
+        out.close()
+    return frames
+
+
+def from_replay(filename):
+    """Game info and states of a replay file."""
+    game = replay.load(filename)
+    return replay.new_game(game).info(), replay.states(game)
+
+
+def from_stream(filename):
+    """Game info and states of a JSON lines state stream, "-" for stdin."""
+    lines = sys.stdin if filename == "-" else open(filename)
+    messages = (json.loads(line) for line in lines if line.strip())
+    return next(messages), (m for m in messages if "step" in m)
+
+
+async def live(ws_path, output, every=1, session=None):
+    """Render the next game the server starts, or the one being played."""
+    queue = asyncio.Queue()
+    handler = asyncio.ensure_future(viewer.messages_handler(ws_path, queue, "json", session))
+
+    async def states():
+        while True:
+            message = await queue.get()
+            if "map" in message:
+                return
+            yield message
+            if viewer.game_over(message, info["timeout"]):
+                return
+
+    info = await queue.get()
+    out = writer(output, max(1, info["fps"] // every))
+    renderer = Renderer(info)
+    if "state" in info:
+        await queue.get()  # late join, the snapshot state is in the info
+        out.write(renderer.frame(info["state"]))
+    try:
+        i = 0
+        async for state in states():
+            surface = renderer.frame(state)
+            if i % every == 0:
+                out.write(surface)
+            i += 1
+    finally:
+        out.close()
+        handler.cancel()
+
+
+if __name__ == "__main__":
+    quiet()
+
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--replay", help="replay file saved by the server")
+    source.add_argument("--stream", help="JSON lines state stream, - for stdin")
+    source.add_argument("--server", help="render the next game of this server (host:port)")
+    parser.add_argument("--session", help="id of the game session to render", type=int, default=None)
+    parser.add_argument("--every", help="keep one frame out of every", type=int, default=1)
+    parser.add_argument(
+        "output", help="directory for PNG frames, .gif or a video file (.mp4, ...)"
+    )
+    args = parser.parse_args()
+
+    if args.server:
+        asyncio.run(live(f"ws://{args.server}/viewer", args.output, args.every, args.session))
+    else:
+        info, states = from_replay(args.replay) if args.replay else from_stream(args.stream)
+        print(render(info, states, args.output, args.every), "frames")
@@ -0,0 +1,164 @@
+"""Record games and play them again.
+
+A game only depends on its seed, its configuration and the key applied on
+each tick, so a replay stores just that plus the final result. Replays are
+JSON files with the keys packed as a string, one character per tick ("."
+for no key), and can be re-simulated headlessly to check the result or
+streamed to a viewer at any speed.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+import websockets
+
+import game as game_module
+from game import Game
+from headless import quiet
+from mapa import Map
+
+logger = logging.getLogger("Replay")
+logger.setLevel(logging.INFO)
+
+VERSION = 1
+KEYS = "wasdAB"  # every other key does nothing
+NO_KEY = "."
+
+
+def pack_keys(keys):
+    return "".join(k if k and k in KEYS else NO_KEY for k in keys)
+
+
+def unpack_keys(keys):
+    return ["" if k == NO_KEY else k for k in keys]
+
+
+def record(game, player=None):
+    """Replay of a game that has been played from start() on."""
+    return {
+        "version": VERSION,
+        "player": player or game._player_name,
+        "seed": game.seed,
+        "level": game.initial_level,
+        "lives": game._initial_lives,
+        "timeout": game._timeout,
+        "size": list(game.map.size),
+        "numpy": game._map_class is not Map,
+        "pathfinding": game.pathfinding,
+        "keys": pack_keys(game.keys),
+        "result": {
+            "score": game.score,
+            "total_steps": game.total_steps,
+            "level": game.map.level,
+        },
+    }
+
+
+def save(replay, filename):
+    with open(filename, "w") as outfile:
+        json.dump(replay, outfile, separators=(",", ":"))
+
+
+def load(filename):
+    with open(filename) as infile:
+        replay = json.load(infile)
+    if replay.get("version") != VERSION:
+        raise ValueError(f"{filename}: unsupported replay version {replay.get('version')}")
+    return replay
+
+
+def new_game(replay):
+    map_class = Map
+    if replay["numpy"]:
+        from arraymap import ArrayMap as map_class
+
+    game = Game(
+        replay["level"],
+        replay["lives"],
+        replay["timeout"],
+        tuple(replay["size"]),
+        map_class=map_class,
+        seed=replay["seed"],
+        pathfinding=replay.get("pathfinding", False),
+    )
+    game.start(replay["player"])
+    return game
+
+
+def states(replay):
+    """Re-simulate the replay, yielding the state of every tick."""
+    game = new_game(replay)
+    for key in unpack_keys(replay["keys"]):
+        if not game.running:
+            break
+        yield game.step(key)
+
+
+def simulate(replay):
+    """Re-simulate the replay as fast as possible, returns the game result."""
+    game = new_game(replay)
+    for key in unpack_keys(replay["keys"]):
+        if not game.running:
+            break
+        game.step(key)
+    return {
+        "score": game.score,
+        "total_steps": game.total_steps,
+        "level": game.map.level,
+    }
+
+
+def verify(replay):
+    """True if re-simulating the replay gives the recorded result."""
+    return simulate(replay) == replay["result"]
+
+
+async def serve(replay, bind="", port=8000, speed=1.0):
+    """Stream the replay to every viewer that joins, as the server would."""
+    fps = game_module.GAME_SPEED * speed
+
+    async def handler(websocket, path):
+        await websocket.recv()  # join
+        game = new_game(replay)
+        info = game.info()
+        info["fps"] = max(1, round(fps))
+        info["highscores"] = [[replay["player"], replay["result"]["score"]]]
+        await websocket.send(json.dumps(info))
+        for state in states(replay):
+            await asyncio.sleep(1.0 / fps)
+            await websocket.send(json.dumps(state))
+        await websocket.close()
+
+    async with websockets.serve(handler, bind, port):
+        logger.info(f"Replaying {replay['player']} @ {bind}:{port} at {speed}x")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    quiet()
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("verify", help="re-simulate and compare the results")
+    check.add_argument("replays", nargs="+")
+    show = commands.add_parser("serve", help="stream a replay to the viewer")
+    show.add_argument("replay")
+    show.add_argument("--bind", help="IP address to bind to", default="")
+    show.add_argument("--port", help="TCP port", type=int, default=8000)
+    show.add_argument("--speed", help="playback speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        failed = 0
+        for filename in args.replays:
+            replay = load(filename)
+            result = simulate(replay)
+            ok = result == replay["result"]
+            failed += not ok
+            print(f"{'OK' if ok else 'MISMATCH':8} {filename} {json.dumps(result)}")
+        sys.exit(1 if failed else 0)
+
+    logging.disable(logging.NOTSET)
+    asyncio.run(serve(load(args.replay), args.bind, args.port, args.speed))
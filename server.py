@@ -1,14 +1,26 @@
-import requests
 import argparse
 import asyncio
 import json
 import logging
 import websockets
+import websockets.exceptions
+import itertools
 import pickle
 import os.path
 import random
-from collections import namedtuple
+import re
+import time
+from collections import OrderedDict, deque, namedtuple
+from delta import DeltaEncoder, KEYFRAME_INTERVAL, delta_frame, key_frame
+import game as game_module
 from game import Game
+from mapa import Map
+from protocol import BinaryEncoder, ENCODINGS
+from ticker import MAX_CATCH_UP
+from profiler import Profiler
+from metrics import BYTES, Registry, serve as serve_metrics
+from spool import BATCH, GradingSpool
+import replay
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -23,120 +35,567 @@ Player = namedtuple("Player", ["name", "ws"])
 
 MAX_HIGHSCORES = 10
 HIGHSCORE_FILE = "highscores.json"
+GRADING_SPOOL = "grading-spool"  # results not accepted by the grading server yet
+MAX_SESSIONS = 10
+VIEWER_QUEUE = 20  # frames queued for a viewer before the oldest are dropped
+MAX_VIEWER_LAG = 50  # frames a viewer may drop in a row before it is evicted
+
+
+def message_size(message):
+    """Bytes a websocket message takes.
+
+    Text frames are json.dumps output, ASCII only (non-ASCII is escaped), so
+    their length is their size in UTF-8 without encoding them again."""
+    return len(message)
+
+
+class Metrics(Registry):
+    """What the server exposes on --metrics-port."""
+
+    def __init__(self, server):
+        super().__init__()
+        self.tick_duration = self.histogram(
+            "bomberman_tick_duration_seconds",
+            "Time spent on a tick: simulation, encoding and sending to the player",
+        )
+        self.tick_lateness = self.histogram(
+            "bomberman_tick_lateness_seconds", "Time a tick started after its deadline"
+        )
+        self.encode_time = self.histogram(
+            "bomberman_state_encode_seconds", "Time spent encoding a state in all encodings"
+        )
+        self.sent_bytes = self.counter(
+            "bomberman_sent_bytes_total", "Bytes sent", ["role"]
+        )
+        self.connection_bytes = self.histogram(
+            "bomberman_connection_sent_bytes",
+            "Bytes sent to a connection, observed when it ends",
+            ["role"],
+            BYTES,
+        )
+        self.send_latency = self.histogram(
+            "bomberman_send_seconds", "Time a websocket send took", ["role"]
+        )
+        self.dropped_frames = self.counter(
+            "bomberman_viewer_dropped_frames_total", "Frames dropped for slow viewers"
+        )
+        self.evicted = self.counter(
+            "bomberman_viewer_evictions_total", "Viewers disconnected for falling behind"
+        )
+        self.games = self.counter(
+            "bomberman_games_completed_total", "Games played until the end"
+        )
+        self.gauge(
+            "bomberman_players_waiting",
+            "Players waiting for a free session",
+            function=server.players.qsize,
+        )
+        self.gauge(
+            "bomberman_sessions", "Games being played", function=lambda: len(server.sessions)
+        )
+        self.gauge(
+            "bomberman_viewers", "Connected viewers", function=lambda: len(server.viewers)
+        )
+        self.gauge(
+            "bomberman_grading_pending",
+            "Results waiting to be sent to the grading server",
+            function=lambda: server.grading.pending if server.grading else 0,
+        )
+
+
+class Viewer:
+    """Spectator connection, sent frames through its own bounded queue.
+
+    Messages are queued without waiting and written by the viewer's own
+    task. When the queue is full the oldest state frame is dropped (all of
+    them for delta frames, which build on each other); game info and
+    snapshots are never dropped. A viewer that drops more than max_lag
+    frames before one gets through is evicted. Viewers can ask for fewer
+    frames per second than the game runs at."""
+
+    def __init__(self, websocket, encoding="json", fps=None, on_close=None, metrics=None, queue_size=VIEWER_QUEUE, max_lag=MAX_VIEWER_LAG):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.every = max(1, round(game_module.GAME_SPEED / fps)) if fps else 1
+        self.base = None  # frame the client holds once the queue is written
+        self.dropped = 0
+        self.lag = 0  # frames dropped since the last one was sent
+        self.evicted = False
+        self.sent_bytes = 0
+        self.max_lag = max_lag
+        self._metrics = metrics
+        self._queue = deque()  # (frame number or None, message)
+        self._queue_size = queue_size
+        self._written = None  # frame the client holds once the messages kept are written
+        self._ready = asyncio.Event()
+        self._on_close = on_close
+        self._task = asyncio.ensure_future(self._write())
+
+    def wants(self, frame):
+        """Whether the frame number is sent given the frame rate asked for."""
+        return frame % self.every == 0
+
+    def reset(self, frame=None):
+        """Start over from frame (a snapshot), dropping the frames still queued."""
+        self._queue = deque(item for item in self._queue if item[0] is None)
+        self.base = self._written = frame
+
+    def make_room(self):
+        """Drop state frames if the queue is full, False once the viewer is evicted."""
+        if self.evicted:
+            return False
+        frames = sum(frame is not None for frame, _ in self._queue)
+        if frames < self._queue_size:
+            return True
+        if self.encoding == "delta":
+            dropped = frames
+            self._queue = deque(item for item in self._queue if item[0] is None)
+            self.base = self._written  # the next delta builds on what the client has
+        else:
+            dropped = 1
+            oldest = next(i for i, (frame, _) in enumerate(self._queue) if frame is not None)
+            del self._queue[oldest]
+        self.dropped += dropped
+        self.lag += dropped
+        if self._metrics:
+            self._metrics.dropped_frames.inc(dropped)
+        if self.lag > self.max_lag:
+            logger.warning(f"Evicting viewer {self.lag} frames behind")
+            if self._metrics:
+                self._metrics.evicted.inc()
+            self.evicted = True
+            self.close()
+            asyncio.ensure_future(self.websocket.close())
+            return False
+        return True
+
+    def send(self, message, frame=None):
+        """Queue message, never waits. frame numbers state frames, the only ones dropped."""
+        if frame is not None and not self.make_room():
+            return
+        if self.evicted:
+            return
+        self._queue.append((frame, message))
+        if frame is not None:
+            self.base = frame
+        self._ready.set()
+
+    async def _write(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                frame, message = self._queue.popleft()
+                if frame is not None:
+                    self._written = frame
+                start = time.perf_counter()
+                await self.websocket.send(message)
+                self.lag = 0
+                size = message_size(message)
+                self.sent_bytes += size
+                if self._metrics:
+                    self._metrics.send_latency.observe(time.perf_counter() - start, role="viewer")
+                    self._metrics.sent_bytes.inc(size, role="viewer")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if self._metrics:
+                self._metrics.connection_bytes.observe(self.sent_bytes, role="viewer")
+            if self._on_close:
+                self._on_close(self)
+
+    def close(self):
+        self._task.cancel()
+
+
+class Session:
+    """A game played by one player, with its own tick loop and viewers."""
+
+    def __init__(self, session_id, player, game, server):
+        self.id = session_id
+        self.player = player
+        self.game = game
+        self.viewers = {}  # websocket -> Viewer
+        self.delta = DeltaEncoder(server.keyframe_interval)
+        self.binary = BinaryEncoder()
+        self.stats = {"frames": 0, "encode_time": 0.0, "bytes": 0}
+        self._snapshots = {}  # encoding -> snapshot of the current frame
+        self._snapshot_frame = None
+        self._history = OrderedDict()  # frame number -> state, the bases of delta viewers
+        self._delta_base = None  # frame the last delta frame applies to, None for a keyframe
+        self._player_bytes = 0
+        self._server = server
+
+    def info(self):
+        return {
+            "id": self.id,
+            "player": self.player.name,
+            "level": self.game.map.level,
+            "score": self.game.score,
+            "viewers": len(self.viewers),
+        }
+
+    def game_info(self):
+        game_info = self.game.info()
+        game_info["highscores"] = self._server.highscores
+        game_info["session"] = self.id
+        return game_info
+
+    def encodings(self):
+        """Encodings used by the player and viewers of this session."""
+        return {viewer.encoding for viewer in self.viewers.values()} | {
+            self._server.encoding(self.player.ws)
+        }
+
+    def encode_info(self, encodings):
+        game_info = self.game_info()
+        frames = {"json": json.dumps(game_info)}
+        frames["delta"] = frames["json"]
+        if "binary" in encodings:
+            frames["binary"] = self.binary.encode_info(game_info)
+        return frames
+
+    def encode_state(self, state, encodings):
+        # every frame is encoded once per encoding in use and the same message sent to all
+        start = time.perf_counter()
+        frames = {}
+        if "json" in encodings:
+            frames["json"] = self.game.state
+        self.stats["frames"] += 1
+        if "delta" in encodings:
+            frame = self.delta.encode(state, self.stats["frames"])
+            frames["delta"] = json.dumps(frame)
+            self._delta_base = frame.get("base")
+            self._history[self.stats["frames"]] = state
+            while len(self._history) > self._server.keyframe_interval:
+                self._history.popitem(last=False)
+        if "binary" in encodings:
+            frames["binary"] = self.binary.encode_state(state)
+        self.stats["encode_time"] += time.perf_counter() - start
+        self.stats["bytes"] += message_size(frames[self._server.encoding(self.player.ws)])
+        return frames
+
+    def snapshot(self, encoding):
+        """Live map and last state in one message, for viewers joining mid game.
+
+        Encoded once per frame and encoding, however many viewers join."""
+        if self._snapshot_frame != self.stats["frames"]:
+            self._snapshots = {}
+            self._snapshot_frame = self.stats["frames"]
+        if encoding not in self._snapshots:
+            snapshot = self.game.snapshot()
+            snapshot["highscores"] = self._server.highscores
+            snapshot["session"] = self.id
+            snapshot["n"] = self.stats["frames"]
+            if encoding == "binary":
+                self._snapshots[encoding] = self.binary.encode_snapshot(snapshot)
+            else:
+                self._snapshots[encoding] = json.dumps(snapshot)
+        return self._snapshots[encoding]
+
+    def add_viewer(self, viewer):
+        """Send a joining viewer the snapshot, then include it in the broadcasts."""
+        if self.game.running:
+            viewer.reset(self.stats["frames"])  # the frame of the snapshot
+            viewer.send(self.snapshot(viewer.encoding))
+        else:
+            viewer.reset()
+        self.viewers[viewer.websocket] = viewer
+
+    def broadcast(self, frames, frame=None):
+        """Queue each viewer the frame in its encoding, never waits for them.
+
+        frame is the number of a state frame, viewers skip the frames they
+        didn't ask for. Delta viewers whose last frame isn't the one before
+        (they skipped or dropped some) get a delta from the last frame they
+        have, or a keyframe if it is too old."""
+        if frame is None:
+            for viewer in list(self.viewers.values()):
+                viewer.send(frames[viewer.encoding])
+            return
+        rebased = {}  # base -> frame from it
+        for viewer in list(self.viewers.values()):
+            if not viewer.wants(frame) or not viewer.make_room():
+                continue
+            if viewer.encoding != "delta" or self._delta_base in (None, viewer.base):
+                viewer.send(frames[viewer.encoding], frame)
+                continue
+            if viewer.base not in rebased:
+                state = self._history[frame]
+                last = self._history.get(viewer.base)
+                if last is None or last.get("level") != state.get("level"):
+                    message = key_frame(state, frame)
+                else:
+                    message = delta_frame(last, state, frame, viewer.base)
+                rebased[viewer.base] = json.dumps(message)
+            viewer.send(rebased[viewer.base], frame)
+
+    def save_replay(self):
+        name = re.sub(r"[^\w-]", "_", self.player.name)
+        filename = os.path.join(
+            self._server.replays,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{self.id}-{name}.json",
+        )
+        try:
+            replay.save(replay.record(self.game, self.player.name), filename)
+            logger.info(f"[{self.id}] Replay saved to {filename}")
+        except OSError as e:
+            logger.warning(f"Could not save replay: {e}")
+
+    async def send_player(self, message):
+        start = time.perf_counter()
+        await self.player.ws.send(message)
+        size = message_size(message)
+        self._player_bytes += size
+        metrics = self._server.metrics
+        metrics.send_latency.observe(time.perf_counter() - start, role="player")
+        metrics.sent_bytes.inc(size, role="player")
+
+    async def run(self):
+        player = self.player
+        encoding = self._server.encoding(player.ws)
+        metrics = self._server.metrics
+        game_rec = None
+        try:
+            logger.info(f"[{self.id}] Starting game for <{player.name}>")
+            self.game.start(player.name)
+
+            #Send game info to viewer and player
+            frames = self.encode_info(self.encodings())
+            self.broadcast(frames)
+            await self.send_player(frames[encoding])
+
+            if self._server.grading:
+                game_rec = dict()
+                game_rec["player"] = player.name
+
+            while self.game.running:
+                state = await self.game.next_frame()
+                start = time.perf_counter()
+                frames = self.encode_state(state, self.encodings())
+                encoded = time.perf_counter()
+                self.broadcast(frames, self.stats["frames"])
+                await self.send_player(frames[encoding])
+                metrics.tick_lateness.observe(self.game.ticker.lateness)
+                metrics.encode_time.observe(encoded - start)
+                metrics.tick_duration.observe(
+                    self.game.step_time + time.perf_counter() - start
+                )
+            self._server.save_highscores(player.name, self.game)
+            metrics.games.inc()
+            logger.info(
+                "[%s] Sent %d frames: %.3f ms and %d bytes per frame",
+                self.id,
+                self.stats["frames"],
+                1000 * self.stats["encode_time"] / max(1, self.stats["frames"]),
+                self.stats["bytes"] / max(1, self.stats["frames"]),
+            )
+            ticker = self.game.ticker
+            logger.info(
+                "[%s] Tick lateness %.1f ms mean, %.1f ms max, %.1f ms jitter, %d ticks skipped",
+                self.id,
+                1000 * ticker.mean_lateness,
+                1000 * ticker.max_lateness,
+                1000 * ticker.jitter,
+                ticker.skipped,
+            )
+            if self.game.profiler:
+                logger.info("[%s] Tick phases:\n%s", self.id, self.game.profiler.report())
+            await self.send_player(json.dumps({"score": self.game.score}))
+
+            logger.info(f"[{self.id}] Disconnecting <{player.name}>")
+        except websockets.exceptions.ConnectionClosed:
+            player = None
+        finally:
+            if game_rec is not None:
+                game_rec["score"] = self.game.score
+                game_rec["total_steps"] = self.game.total_steps
+                game_rec["level"] = self.game.map.level
+                self._server.grading.submit(game_rec)
+
+            if self._server.replays:
+                self.save_replay()
+
+            metrics.connection_bytes.observe(self._player_bytes, role="player")
+
+            if player:
+                await player.ws.close()
 
 
 class Game_server:
-    def __init__(self, level, lives, timeout, grading):
-        self.game = Game(level, lives, timeout)
+    def __init__(self, level, lives, timeout, grading, map_class=Map, keyframe_interval=KEYFRAME_INTERVAL, seed=None, max_sessions=MAX_SESSIONS, replays=None, catch_up=MAX_CATCH_UP, profile=False, grading_spool=None, grading_batch=BATCH, pathfinding=False):
+        self.level = level
+        self.lives = lives
+        self.timeout = timeout
+        self.map_class = map_class
+        self.keyframe_interval = keyframe_interval
+        self.max_sessions = max_sessions
+        self._seeds = random.Random(seed) if seed is not None else None
         self.players = asyncio.Queue()
-        self.viewers = set()
-        self.current_player = None
-        self.grading = grading
+        self.sessions = {}
+        self.playing = {}  # player websocket -> session
+        self.watching = {}  # viewer websocket -> session, None while waiting
+        self.following = set()  # viewer websockets watching the newest session
+        self.viewers = {}  # viewer websocket -> Viewer
+        self.metrics = Metrics(self)
+        self._encodings = {}  # websocket -> encoding it asked for, json by default
+        # results are posted to the grading url in the background, see spool.py
+        self.grading = GradingSpool(grading, grading_spool, batch=grading_batch) if grading else None
+        self.replays = replays  # directory to save a replay of every game in
+        self.catch_up = catch_up  # late ticks a game may run back to back
+        self.profile = profile  # log the cost of each tick phase after every game
+        self.pathfinding = pathfinding  # Pass hunts along distance fields, see game.PATH_LEVEL_ENEMIES
+        self._session_ids = itertools.count(1)
 
-        self._highscores = []
+        self.highscores = []
         if os.path.isfile(HIGHSCORE_FILE):
             with open(HIGHSCORE_FILE, "r") as infile:
-                self._highscores = json.load(infile)
+                self.highscores = json.load(infile)
 
-    def save_highscores(self):
+    def save_highscores(self, name, game):
         # update highscores
         logger.debug("Save highscores")
-        logger.info("FINAL SCORE <%s>: %s with %s steps", self.current_player.name, self.game.score, self.game.total_steps)
+        logger.info("FINAL SCORE <%s>: %s with %s steps", name, game.score, game.total_steps)
 
-        self._highscores.append((self.current_player.name, self.game.score))
-        self._highscores = sorted(self._highscores, key=lambda s: -1 * s[1])[
+        self.highscores.append((name, game.score))
+        self.highscores = sorted(self.highscores, key=lambda s: -1 * s[1])[
             :MAX_HIGHSCORES
         ]
 
         with open(HIGHSCORE_FILE, "w") as outfile:
-            json.dump(self._highscores, outfile)
+            json.dump(self.highscores, outfile)
+
+    def encoding(self, websocket):
+        return self._encodings.get(websocket, "json")
+
+    def new_session(self, player):
+        seed = self._seeds.getrandbits(32) if self._seeds else None
+        game = Game(
+            self.level,
+            self.lives,
+            self.timeout,
+            map_class=self.map_class,
+            seed=seed,
+            catch_up=self.catch_up,
+            pathfinding=self.pathfinding,
+        )
+        if self.profile:
+            game.profiler = Profiler()
+        session = Session(next(self._session_ids), player, game, self)
+        self.sessions[session.id] = session
+        self.playing[player.ws] = session
+
+        # viewers that did not pick a session watch the next game to start
+        for websocket, watched in self.watching.items():
+            if watched is None and websocket in self.following:
+                self.watching[websocket] = session
+                session.add_viewer(self.viewers[websocket])
+        return session
+
+    def end_session(self, session):
+        logger.info(f"[{session.id}] Session ended")
+        del self.sessions[session.id]
+        self.playing.pop(session.player.ws, None)
+        for websocket in session.viewers:
+            if websocket in self.following:
+                self.watching[websocket] = None
+            else:
+                del self.watching[websocket]  # picked this session, it is over
+        session.viewers.clear()
+
+    async def watch(self, websocket, session_id=None, fps=None):
+        """Make a viewer watch a session, by default the newest one."""
+        self.unwatch(websocket)
+        if websocket not in self.viewers:
+            self.viewers[websocket] = Viewer(
+                websocket, self.encoding(websocket), fps, self.viewer_closed, self.metrics
+            )
+        if session_id is None:
+            self.following.add(websocket)
+            session_id = max(self.sessions, default=None)
+        else:
+            self.following.discard(websocket)
+        session = self.sessions.get(session_id)
+        self.watching[websocket] = session
+        if session:
+            session.add_viewer(self.viewers[websocket])
+
+    def unwatch(self, websocket):
+        session = self.watching.pop(websocket, None)
+        if session:
+            session.viewers.pop(websocket, None)
+
+    def viewer_closed(self, viewer):
+        """Forget a viewer that disconnected or was evicted."""
+        self.unwatch(viewer.websocket)
+        self.following.discard(viewer.websocket)
+        self.viewers.pop(viewer.websocket, None)
 
     async def incomming_handler(self, websocket, path):
         try:
             async for message in websocket:
                 data = json.loads(message)
                 if data["cmd"] == "join":
+                    encoding = data.get("encoding") or ("delta" if data.get("delta") else "json")
+                    if encoding in ENCODINGS:
+                        self._encodings[websocket] = encoding
+
                     if path == "/player":
                         logger.info("<%s> has joined", data["name"])
                         await self.players.put(Player(data["name"], websocket))
 
                     if path == "/viewer":
                         logger.info("Viewer connected")
-                        self.viewers.add(websocket)
-                        if self.game.running:
-                            game_info = self.game.info()
-                            game_info["highscores"] = self._highscores
-                            await websocket.send(json.dumps(game_info))
-
-                if data["cmd"] == "key" and self.current_player.ws == websocket:
-                    logger.debug((self.current_player.name, data))
+                        await self.watch(websocket, data.get("session"), data.get("fps"))
+
+                if data["cmd"] == "sessions":
+                    await websocket.send(
+                        json.dumps({"sessions": [s.info() for s in self.sessions.values()]})
+                    )
+
+                if data["cmd"] == "key" and websocket in self.playing:
+                    session = self.playing[websocket]
+                    logger.debug((session.player.name, data))
                     if len(data["key"]):
-                        self.game.keypress(data["key"][0])
+                        session.game.keypress(data["key"][0])
                     else:
-                        self.game.keypress("")
+                        session.game.keypress("")
 
         except websockets.exceptions.ConnectionClosed as c:
             logger.info(f"Client disconnected: {c}")
+        finally:
+            self.unwatch(websocket)
+            self.following.discard(websocket)
             if websocket in self.viewers:
-                self.viewers.remove(websocket)
+                self.viewers.pop(websocket).close()
+            self._encodings.pop(websocket, None)
 
     async def mainloop(self):
+        if self.grading:
+            self.grading.start()
+        slots = asyncio.Semaphore(self.max_sessions)
         while True:
+            await slots.acquire()
             logger.info("Waiting for players")
-            self.current_player = await self.players.get()
+            player = await self.players.get()
 
-            if self.current_player.ws.closed:
-                logger.error(f"<{self.current_player.name}> disconnect while waiting")
+            if player.ws.closed:
+                logger.error(f"<{player.name}> disconnect while waiting")
+                slots.release()
                 continue
 
-            try:
-                logger.info(f"Starting game for <{self.current_player.name}>")
-                self.game.start(self.current_player.name)
-                
-                #Send game info to viewer and player
-                game_info = self.game.info()
-                game_info["highscores"] = self._highscores
-                if self.viewers:
-                    await asyncio.wait(
-                        [
-                            client.send(json.dumps(game_info))
-                            for client in self.viewers
-                        ]
-                    )
-                await self.current_player.ws.send(json.dumps(game_info))
-
-
-                if self.grading:
-                    game_rec = dict()
-                    game_rec["player"] = self.current_player.name
-
-                while self.game.running:
-                    await self.game.next_frame()
-                    await self.current_player.ws.send(self.game.state)
-                    if self.viewers:
-                        await asyncio.wait(
-                            [client.send(self.game.state) for client in self.viewers]
-                        )
-                self.save_highscores()
-                await self.current_player.ws.send(
-                    json.dumps({"score": self.game.score})
-                )
+            session = self.new_session(player)
+            task = asyncio.ensure_future(session.run())
 
-                logger.info(f"Disconnecting <{self.current_player.name}>")
-            except websockets.exceptions.ConnectionClosed:
-                self.current_player = None
-            finally:
-                try:
-                    if self.grading:
-                        game_rec["score"] = self.game.score
-                        game_rec["total_steps"] = self.game.total_steps
-                        game_rec["level"] = self.game.map.level
-                        requests.post(self.grading, json=game_rec)
-                except:
-                    logger.warning("Could not save score to server")
+            def done(task, session=session):
+                if not task.cancelled() and task.exception():
+                    logger.error(f"[{session.id}] Game crashed: {task.exception()!r}")
+                self.end_session(session)
+                slots.release()
 
-                if self.current_player:
-                    await self.current_player.ws.close()
+            task.add_done_callback(done)
 
 
 if __name__ == "__main__":
@@ -154,18 +613,90 @@ if __name__ == "__main__":
         help="url of grading server",
         default="http://bomberman-aulas.ws.atnog.av.it.pt/game",
     )
+    parser.add_argument(
+        "--grading-spool",
+        help="directory keeping the results until the grading server accepts them",
+        default=GRADING_SPOOL,
+    )
+    parser.add_argument(
+        "--grading-batch",
+        help="results posted together, only for grading servers that take a list (prof/grading.py does)",
+        type=int,
+        default=BATCH,
+    )
+    parser.add_argument(
+        "--keyframe-interval",
+        help="ticks between full states for clients using delta frames",
+        type=int,
+        default=KEYFRAME_INTERVAL,
+    )
+    parser.add_argument(
+        "--max-sessions",
+        help="number of games played at the same time",
+        type=int,
+        default=MAX_SESSIONS,
+    )
+    parser.add_argument(
+        "--numpy", help="use the numpy array backed map", action="store_true"
+    )
+    parser.add_argument("--replays", help="save a replay of every game in this directory")
+    parser.add_argument(
+        "--pathfinding",
+        help="Pass enemies hunt along the map instead of the classic rules",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        help="serve Prometheus metrics on http://localhost:PORT/metrics",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile", help="log the cost of each tick phase after every game", action="store_true"
+    )
+    parser.add_argument(
+        "--catch-up",
+        help="late ticks run back to back to catch up, more are skipped",
+        type=int,
+        default=MAX_CATCH_UP,
+    )
     args = parser.parse_args()
 
-    if args.seed > 0:
-        random.seed(args.seed)
+    map_class = Map
+    if args.numpy:
+        from arraymap import ArrayMap as map_class
 
-    g = Game_server(args.level, args.lives, args.timeout, args.grading_server)
+    g = Game_server(
+        args.level,
+        args.lives,
+        args.timeout,
+        args.grading_server,
+        map_class,
+        args.keyframe_interval,
+        args.seed or None,
+        args.max_sessions,
+        args.replays,
+        args.catch_up,
+        args.profile,
+        args.grading_spool or None,
+        args.grading_batch,
+        pathfinding=args.pathfinding,
+    )
+
+    loop = asyncio.get_event_loop()
+    if args.metrics_port:
+        loop.run_until_complete(serve_metrics(g.metrics, "127.0.0.1", args.metrics_port))
 
     game_loop_task = asyncio.ensure_future(g.mainloop())
 
     logger.info(f"Listenning @ {args.bind}:{args.port}")
     websocket_server = websockets.serve(g.incomming_handler, args.bind, args.port)
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(asyncio.gather(websocket_server, game_loop_task))
-    loop.close()
+    try:
+        loop.run_until_complete(asyncio.gather(websocket_server, game_loop_task))
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        if g.grading:
+            loop.run_until_complete(g.grading.close())
+        loop.close()
@@ -0,0 +1,275 @@
+"""Submit game results to the grading server without holding up the games.
+
+submit() returns at once: the result is written to the spool directory, if
+any, by the spool's own writer thread, and queued. A worker task posts
+the queued results in batches (a JSON list, or the result itself when
+there is only one; only grading servers that take lists should get
+batches) and retries with exponential backoff while the grading server is
+slow or down. A batch the grading server refuses, or fails on
+max_attempts times, is split in halves down to single results, so a bad
+result doesn't hold up the others; a single one is set aside as rejected.
+A result leaves the spool only once the grading server accepted or
+rejected it, so the ones still pending when the server stops are sent
+again after a restart.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+logger = logging.getLogger("Grading")
+logger.setLevel(logging.INFO)
+
+QUEUE_SIZE = 1000  # results waiting in memory, the others wait in the spool
+BATCH = 1  # results posted together, more for grading servers that take lists
+TIMEOUT = 5.0  # seconds for a request to the grading server
+BACKOFF = 1.0  # first retry delay, doubled on every failure
+MAX_BACKOFF = 60.0
+MAX_ATTEMPTS = 5  # server errors on a batch before it is split or rejected
+RETRY_STATUS = (408, 429)  # client errors worth trying again, however many times
+
+
+class GradingSpool:
+    def __init__(
+        self,
+        url,
+        directory=None,
+        queue_size=QUEUE_SIZE,
+        batch=BATCH,
+        timeout=TIMEOUT,
+        backoff=BACKOFF,
+        max_backoff=MAX_BACKOFF,
+        max_attempts=MAX_ATTEMPTS,
+    ):
+        self.url = url
+        self.directory = directory
+        self.batch = batch
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.queue = asyncio.Queue(queue_size)  # (spool file or None, result)
+        self.sent = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._queued = set()  # spool files queued or being sent
+        self._writing = set()  # spool files being written
+        self._writes = set()  # their futures
+        self._spooled = 0  # spool files not sent yet, queued or not
+        self._overflow = False  # spool files left out of a full queue
+        self._ids = itertools.count()
+        self._task = None
+        self._executor = ThreadPoolExecutor(1, "grading-spool")  # spool files in order
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._spooled = sum(name.endswith(".json") for name in os.listdir(directory))
+            self._load()
+
+    @property
+    def pending(self):
+        """Results waiting to be sent, in the queue or only in the spool."""
+        return self.queue.qsize() + self._spooled - len(self._queued) + len(self._writing)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def flush(self):
+        """Wait for the results submitted to be in the spool and queued."""
+        if self._writes:
+            await asyncio.wait(self._writes)
+
+    async def _drain(self):
+        await self.queue.join()
+        while self._overflow:  # the worker queues the rest of the spool
+            await asyncio.sleep(0.01)
+            await self.queue.join()
+
+    async def close(self, timeout=TIMEOUT):
+        """Give the worker up to timeout seconds to send what is queued, then stop it."""
+        await self.flush()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "%d results not sent%s",
+                self.pending,
+                ", they are kept in the spool" if self.directory else "",
+            )
+        self._task.cancel()
+        self._task = None
+
+    def submit(self, result):
+        if not self.directory:
+            self._queue(None, result)
+            return
+        filename = os.path.join(self.directory, f"{time.time_ns()}-{next(self._ids)}.json")
+        self._writing.add(filename)
+        write = asyncio.get_event_loop().run_in_executor(
+            self._executor, self._spool, filename, result
+        )
+        self._writes.add(write)
+
+        def written(write):
+            self._writes.discard(write)
+            self._writing.discard(filename)
+            if write.result():
+                self._spooled += 1
+                self._queue(filename, result)
+            else:
+                self._queue(None, result)
+
+        write.add_done_callback(written)
+
+    def _queue(self, filename, result):
+        try:
+            self.queue.put_nowait((filename, result))
+        except asyncio.QueueFull:
+            if filename:
+                self._overflow = True
+                logger.warning("Grading queue full, %s waits in the spool", filename)
+            else:
+                self.dropped += 1
+                logger.error("Grading queue full, dropping the result of <%s>", result.get("player"))
+            return
+        if filename:
+            self._queued.add(filename)
+
+    def _spool(self, filename, result):
+        """Write result to filename, runs in the writer thread."""
+        try:
+            with open(filename + ".tmp", "w") as outfile:
+                json.dump(result, outfile)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.replace(filename + ".tmp", filename)  # never a half written result
+        except OSError as e:
+            logger.warning(f"Could not spool the result of <{result.get('player')}>: {e}")
+            return False
+        return True
+
+    def _load(self, spooled=None):
+        """Queue the spooled results, oldest first, as long as there is room."""
+        room = self.queue.maxsize - self.queue.qsize() if self.queue.maxsize > 0 else None
+        if spooled is None:
+            spooled = self._read(self._queued | self._writing, room)
+        for filename, result in spooled:
+            if result is None:
+                self._spooled -= 1  # unreadable, set aside
+            else:
+                self._queue(filename, result)
+        if room is not None and len(spooled) >= room:
+            self._overflow = True  # maybe more to read
+
+    def _read(self, skip, room=None):
+        """(filename, result) of up to room spooled results but skip, oldest first.
+
+        The result is None for the files that can't be read, they are renamed
+        .bad. Also runs in the writer thread."""
+        results = []
+        for name in sorted(os.listdir(self.directory)):
+            filename = os.path.join(self.directory, name)
+            if not name.endswith(".json") or filename in skip:
+                continue
+            if room is not None and len(results) >= room:
+                break
+            try:
+                with open(filename) as infile:
+                    results.append((filename, json.load(infile)))
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read {filename}: {e}")
+                os.replace(filename, filename + ".bad")
+                results.append((filename, None))
+        return results
+
+    async def _remove(self, filename, rejected=False):
+        if filename is None:
+            return
+        await asyncio.get_event_loop().run_in_executor(
+            self._executor, self._unspool, filename, rejected
+        )
+        self._queued.discard(filename)
+        self._spooled -= 1
+
+    def _unspool(self, filename, rejected):
+        """Remove filename from the spool, runs in the writer thread."""
+        try:
+            if rejected:
+                os.replace(filename, filename + ".rejected")  # kept to be looked at
+            else:
+                os.remove(filename)
+        except OSError as e:
+            logger.warning(f"Could not remove {filename} from the spool: {e}")
+
+    async def _post(self, session, results):
+        """Post the results: "sent", "rejected" for good, "failed" on a server
+        error, or None when worth trying again however many times."""
+        try:
+            async with session.post(
+                self.url, json=results[0] if len(results) == 1 else results
+            ) as response:
+                if response.status < 300:
+                    return "sent"
+                if response.status < 500 and response.status not in RETRY_STATUS:
+                    logger.error(
+                        "Grading server rejected %d results: HTTP %d", len(results), response.status
+                    )
+                    return "rejected"
+                logger.warning("Grading server answered HTTP %d", response.status)
+                return "failed" if response.status >= 500 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not reach the grading server: {e!r}")
+        return None
+
+    async def _send(self, session, batch):
+        """Post the batch until it is sent or rejected, in halves if it keeps failing."""
+        delay = self.backoff
+        attempts = 0
+        while (outcome := await self._post(session, [r for _, r in batch])) in (None, "failed"):
+            attempts += outcome == "failed"
+            if attempts >= self.max_attempts:
+                break
+            await asyncio.sleep(delay * random.uniform(0.5, 1))
+            delay = min(2 * delay, self.max_backoff)
+
+        if outcome != "sent" and len(batch) > 1:
+            logger.warning("Splitting a batch of %d results", len(batch))
+            half = len(batch) // 2
+            await self._send(session, batch[:half])
+            await self._send(session, batch[half:])
+            return
+        if outcome == "sent":
+            self.sent += len(batch)
+        else:
+            self.rejected += 1
+            logger.error("Gave up on the result of <%s>", batch[0][1].get("player"))
+        for filename, _ in batch:
+            await self._remove(filename, rejected=outcome != "sent")
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                if self._overflow and self.queue.empty():
+                    spooled = await loop.run_in_executor(
+                        self._executor, self._read, self._queued | self._writing, self.queue.maxsize or None
+                    )
+                    self._overflow = False
+                    self._load(spooled)
+
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+
+                await self._send(session, batch)
+                for _ in batch:
+                    self.queue.task_done()
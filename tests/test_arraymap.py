@@ -0,0 +1,53 @@
+import pytest
+import random
+
+np = pytest.importorskip("numpy")
+
+from arraymap import ArrayMap
+from game import Game
+from mapa import *
+
+
+def test_same_as_map():
+    mapa = Map(level=3, enemies=4, size=(21, 15))
+    array = ArrayMap(size=(21, 15), mapa=mapa.map)
+
+    assert array.walls == mapa.walls
+    assert array.map == mapa.map
+    for x in range(-1, 22):
+        for y in range(-1, 16):
+            assert array.is_blocked((x, y)) == mapa.is_blocked((x, y))
+            assert array.is_blocked((x, y), True) == mapa.is_blocked((x, y), True)
+            assert array.is_stone((x, y)) == mapa.is_stone((x, y))
+            for d in "wasd":
+                assert array.calc_pos((x, y), d) == mapa.calc_pos((x, y), d)
+
+    wall = mapa.walls[0]
+    array.remove_wall(wall)
+    assert array.get_tile(wall) == Tiles.PASSAGE
+    assert wall not in array.walls
+
+
+def test_generate():
+    random.seed(1)
+    mapa = ArrayMap(level=2, enemies=6, size=(51, 31))
+    assert len(mapa.enemies_spawn) == 6
+    assert all(not mapa.is_blocked(e) for e in mapa.enemies_spawn)
+    assert mapa.exit_door in mapa.walls and mapa.powerup in mapa.walls
+    assert mapa.exit_door != mapa.powerup
+    assert mapa.wall_mask().sum() == len(mapa.walls)
+
+    buf = mapa.buffer()
+    assert buf.nbytes == 51 * 31
+    assert np.shares_memory(np.asarray(buf), mapa.tiles)
+    assert ArrayMap(size=(51, 31), mapa=buf).walls == mapa.walls
+
+    assert mapa.neighbours((1, 1)) == [(1, 2), (2, 1)]
+
+
+def test_game():
+    game = Game(map_class=ArrayMap, timeout=100)
+    game.start("John Doe")
+    while game.running:
+        game.step(random.choice("wasdB"))
+    assert isinstance(game.map, ArrayMap)
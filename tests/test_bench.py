@@ -0,0 +1,26 @@
+import pytest
+import copy
+
+import bench
+
+
+def test_run(tmp_path):
+    results = bench.run_all(["game/tick/level1", "*/bomb_in_range/dense"], repeat=1)
+    assert "game/tick/level1" in results["benchmarks"]
+    assert "map/bomb_in_range/dense" in results["benchmarks"]
+    assert all(r["seconds"] > 0 for r in results["benchmarks"].values())
+
+    bench.save(results, tmp_path / "baseline.json")
+    assert bench.load(tmp_path / "baseline.json") == results
+
+
+def test_compare():
+    baseline = {"benchmarks": {"a": {"seconds": 1.0}, "b": {"seconds": 1.0}, "c": {"seconds": 1.0}}}
+    current = copy.deepcopy(baseline)
+    current["benchmarks"]["a"]["seconds"] = 1.1
+    current["benchmarks"]["b"]["seconds"] = 1.5
+    current["benchmarks"]["d"] = {"seconds": 9.0}  # new, nothing to compare with
+    del current["benchmarks"]["c"]
+
+    rows = bench.compare(baseline, current, threshold=0.25)
+    assert [(name, slower) for name, _, _, _, slower in rows] == [("a", False), ("b", True)]
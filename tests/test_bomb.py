@@ -99,3 +99,23 @@ def test_bomb():
         game.explode_bomb()
 
     assert len(game._enemies) == 0
+
+def test_blast():
+    mapa = Map(size=(13,13), mapa=mapa13x13)
+
+    # rays stop at the border stones, walls do not stop them
+    bomb = Bomb((1,1), mapa, 3)
+    assert sorted(bomb.blast) == [(1,1), (1,2), (1,3), (1,4), (2,1), (3,1), (4,1)]
+
+    # only the upward ray is clipped
+    bomb = Bomb((3,2), mapa, 2)
+    assert sorted(bomb.blast) == [(1,2), (2,2), (3,1), (3,2), (3,3), (3,4), (4,2), (5,2)]
+
+    game = Game()
+    game.start("John Doe")
+    game.step("B")
+    for _ in range(2*(MIN_BOMB_RADIUS + 1) + 1):
+        state = game.step("")
+        if state["explosions"]:
+            break
+    assert state["explosions"] == [Bomb((1,1), game.map, MIN_BOMB_RADIUS).blast]
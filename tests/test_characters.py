@@ -0,0 +1,74 @@
+import pytest
+from characters import *
+from game import Bomb
+from mapa import Map
+
+
+def test_move_enemies():
+    mapa = Map(size=(13, 13), empty=True)
+    bomberman = Bomberman((1, 1))
+    # (3,3) would run away from bomberman to (4,3) or (3,4), both taken
+    enemies = [Minvo((3, 3)), Minvo((4, 3)), Minvo((3, 4))]
+    enemies[0].lastpos = (2, 3)
+
+    move_enemies(enemies, mapa, bomberman, [])
+    assert enemies[0].pos == (3, 2)
+    assert len({e.pos for e in enemies}) == 3
+
+    # enemies sharing a cell do not block each other's moves out of it
+    enemies = [Minvo((5, 5)), Minvo((5, 5))]
+    move_enemies(enemies, mapa, bomberman, [])
+    assert enemies[0].pos == (5, 6)
+    assert enemies[1].pos == (6, 5)
+
+
+def test_pathfinding():
+    mapa = Map(size=(13, 13), empty=True)
+    mapa.walls = [(1, 2), (1, 3), (2, 1), (3, 1)]
+    bomberman = Bomberman((1, 1))
+    enemy = Enemy((5, 5), "Hunter", 100, Speed.FAST, Smart.PATH, False)
+    field = mapa.distance_field([bomberman.pos])
+
+    assert field.get(enemy.pos) is None  # bomberman is walled in
+    move_enemies([enemy], mapa, bomberman, [])
+    assert enemy.pos == (5, 5)
+
+    mapa.remove_wall((2, 1))
+    mapa.remove_wall((3, 1))
+    assert field.get(enemy.pos) == 8
+    for step in range(1, 9):
+        move_enemies([enemy], mapa, bomberman, [])
+        assert field[enemy.pos] == 8 - step
+    assert enemy.pos == bomberman.pos
+
+
+def test_flee_bombs():
+    mapa = Map(size=(13, 13), empty=True)
+    bomberman = Bomberman((1, 1))
+    enemy = PathPass((3, 1))
+    bomb = Bomb((1, 1), mapa, 2)
+
+    move_enemies([enemy], mapa, bomberman, [bomb])
+    field = mapa.distance_field([bomb.pos])
+    assert field[enemy.pos] == 3
+    for _ in range(5):
+        before = field[enemy.pos]
+        move_enemies([enemy], mapa, bomberman, [bomb])
+        assert field[enemy.pos] > before
+
+    # no bombs left, back to the chase
+    before = mapa.distance_field([bomberman.pos])[enemy.pos]
+    move_enemies([enemy], mapa, bomberman, [])
+    assert mapa.distance_field([bomberman.pos])[enemy.pos] == before - 1
+
+
+def test_pathfinding_opt_in():
+    from game import Game
+
+    def passes(**kw):
+        game = Game(level=14, seed=1, **kw)
+        game.start("John Doe")
+        return [e for e in game._enemies if e._name == "Pass"]
+
+    assert [e._smart for e in passes()] == [Smart.HIGH]  # the classic rules
+    assert [e._smart for e in passes(pathfinding=True)] == [Smart.PATH]
@@ -0,0 +1,60 @@
+import pytest
+import json
+import random
+
+from delta import *
+from game import Game
+
+
+def test_roundtrip():
+    random.seed(3)
+    game = Game(level=5, timeout=300, seed=3)
+    game.start("John Doe")
+    encoder = DeltaEncoder(keyframe_interval=20)
+    decoder = DeltaDecoder()
+
+    full_size = delta_size = 0
+    while game.running:
+        state = game.step(random.choice("wasdB"))
+        full = json.dumps(state)
+        frame = json.dumps(encoder.encode(state))
+        assert decoder.apply(json.loads(frame)) == json.loads(full)
+        full_size += len(full)
+        delta_size += len(frame)
+
+    assert delta_size < full_size / 5
+    assert decoder.apply({"score": 10}) == {"score": 10}
+
+
+def test_diff_list():
+    assert diff_list([(1, 1), (2, 2), (3, 3)], [(1, 1), (3, 3)]) == {"del": [(2, 2)]}
+    assert diff_list([(1, 1), (2, 2)], [(2, 2), (1, 1)]) is None
+
+    old = [{"id": "a", "pos": (1, 1)}, {"id": "b", "pos": (2, 2)}]
+    new = [{"id": "b", "pos": (2, 3)}, {"id": "c", "pos": (5, 5)}]
+    changes = diff_list(old, new)
+    assert changes == {"del": ["a"], "upd": [{"id": "b", "pos": (2, 3)}], "add": [new[1]]}
+    assert patch_list(old, changes) == new
+
+
+def test_delta_before_keyframe():
+    with pytest.raises(ValueError):
+        DeltaDecoder().apply({"frame": "delta", "set": {}, "diff": {}})
+
+
+def test_base_mismatch():
+    game = Game(level=1, timeout=30, seed=1)
+    game.start("John Doe")
+    encoder = DeltaEncoder()
+    states = [game.step(key) for key in "ddssdd"]
+    frames = [encoder.encode(state, n) for n, state in enumerate(states, 1)]
+    assert [(f["frame"], f.get("base")) for f in frames[:3]] == [("key", None), ("delta", 1), ("delta", 2)]
+    assert encoder.encode(states[0], 10)["frame"] == "key"  # frame 9 was never encoded
+
+    decoder = DeltaDecoder()
+    decoder.apply(frames[0])
+    with pytest.raises(ValueError):
+        decoder.apply(frames[2])  # frame 2 is missing
+    # a delta from an older frame is fine once the decoder has that frame
+    decoder.apply(frames[1])
+    assert decoder.apply(delta_frame(states[1], states[4], 5, 2)) == states[4]
@@ -0,0 +1,81 @@
+import pytest
+import importlib
+import os
+
+pytest.importorskip("flask_sqlalchemy")
+pytest.importorskip("flask_marshmallow")
+
+
+@pytest.fixture
+def grading(monkeypatch):
+    monkeypatch.setenv("GRADING_DB", "sqlite://")  # in memory
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(__file__), "..", "prof"))
+    grading = importlib.import_module("grading")
+    with grading.app.app_context():
+        grading.db.drop_all()
+        grading.db.create_all()
+        yield grading
+        grading.db.session.remove()
+
+
+def game(player, score, level=1):
+    return {"player": player, "score": score, "level": level, "total_steps": 10 * score}
+
+
+def leaderboard(client, **args):
+    response = client.get("/highscores", query_string=args)
+    assert response.status_code == 200
+    return [(entry["player"], entry["score"]) for entry in response.json]
+
+
+def test_leaderboard(grading):
+    client = grading.app.test_client()
+    response = client.post("/game", json=[game("ann", 10), game("ann", 30), game("bob", 20)])
+    assert [g["score"] for g in response.json] == [10, 30, 20]
+    assert leaderboard(client) == [("ann", 30), ("bob", 20)]  # one entry for ann, the best
+
+    client.post("/game", json=game("bob", 15))  # not the best of bob
+    client.post("/game", json=game("cid", 5))
+    assert leaderboard(client) == [("ann", 30), ("bob", 20), ("cid", 5)]
+    assert grading.Leaderboard.query.get("bob").game_id == 3
+
+
+def test_bad_game(grading):
+    client = grading.app.test_client()
+    assert client.post("/game", json=[game("ann", 10), {"player": "bob"}]).status_code == 400
+    assert client.post("/game", json="ann").status_code == 400
+    assert leaderboard(client) == []  # nothing of the batch was added
+
+
+def test_etag(grading):
+    client = grading.app.test_client()
+    client.post("/game", json=game("ann", 10))
+    etag = client.get("/highscores").headers["ETag"]
+    assert client.get("/highscores", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/game", json=game("ann", 5))  # the leaderboard is the same
+    assert client.get("/highscores", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/game", json=game("ann", 20))  # new best score
+    response = client.get("/highscores", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json[0]["score"] == 20
+
+
+def test_pages(grading):
+    client = grading.app.test_client()
+    client.post("/game", json=[game(f"player{n:02}", n % 7) for n in range(45)])
+    pages = []
+    args = {}
+    while entries := client.get("/highscores", query_string=args).json:
+        pages.append(entries)
+        last = entries[-1]
+        args = {key: last[key] for key in ("score", "timestamp", "player")}
+    assert [len(page) for page in pages] == [20, 20, 5]
+
+    ranked = [(entry["score"], entry["player"]) for page in pages for entry in page]
+    assert ranked == sorted(ranked, reverse=True)  # same timestamps, ties go by player
+    assert len(set(ranked)) == 45
+
+    assert client.get("/highscores", query_string={"player": "x"}).status_code == 400
@@ -0,0 +1,116 @@
+import pytest
+import json
+import sys
+import random
+from game import *
+from headless import load_agent, play
+from mapa import MapPool
+
+
+class Idle:
+    def __init__(self, game_info):
+        self.game_info = game_info
+
+    def __call__(self, state):
+        return ""
+
+
+def test_step():
+    game = Game(timeout=10)
+    game.start("John Doe")
+
+    state = game.step()
+    assert state["step"] == 1
+    assert state["player"] == "John Doe"
+
+    state = game.step("d")
+    assert state["step"] == 2
+    assert game._lastkeypress == ""
+
+    for _ in range(8):
+        game.step()
+    assert not game.running
+
+
+def test_play():
+    result = play(Idle, player="idle", timeout=50, seed=1)
+    assert result["player"] == "idle"
+    assert result["total_steps"] == 50
+    assert result["level"] == 1
+
+
+def test_state_encoded_once():
+    game = Game(timeout=10)
+    game.start("John Doe")
+    game.step()
+
+    encoded = game.state
+    assert game.state is encoded
+    assert json.loads(encoded)["step"] == 1
+    assert game.state_size == len(encoded)
+    assert game.state_encode_time > 0
+
+    game.step()
+    assert game.state is not encoded
+
+
+def test_seed():
+    def walls(seed):
+        game = Game(level=3, seed=seed)
+        random.seed()  # the global generator must not matter
+        game.start("John Doe")
+        return game.map.walls, game.map.enemies_spawn, game.map.exit_door
+
+    assert walls(42) == walls(42)
+    assert walls(42) != walls(43)
+
+    game = Game(level=3, seed=1)
+    game.start("John Doe", seed=42)
+    assert (game.map.walls, game.map.enemies_spawn, game.map.exit_door) == walls(42)
+
+
+def test_map_pool():
+    pool = MapPool(MAP_SIZE)
+    Game(level=2, seed=9, map_pool=pool).start("John Doe")
+    assert (pool.hits, pool.misses) == (0, 1)
+
+    pooled = Game(level=2, seed=9, map_pool=pool)
+    pooled.start("John Doe")
+    game = Game(level=2, seed=9)
+    game.start("John Doe")
+    assert (pool.hits, pool.misses) == (1, 1)
+    assert pooled.map.walls == game.map.walls
+    assert pooled.map.enemies_spawn == game.map.enemies_spawn
+
+
+def test_profile():
+    from profiler import Profiler
+
+    profiler = Profiler()
+    play(Idle, timeout=20, seed=1, profiler=profiler)
+
+    phases = {phase for level, phase in profiler.phases}
+    assert phases == {name for name, _ in Game()._phases}
+    assert all(h.count == 20 for h in profiler.phases.values())
+    assert profiler.report().count("\n") == len(phases)
+    for line in profiler.folded().splitlines():
+        stack, weight = line.rsplit(" ", 1)
+        assert stack.startswith("game;level 1;") and int(weight) >= 0
+
+
+def test_load_agent(tmp_path, monkeypatch):
+    (tmp_path / "cwd_agent.py").write_text("class Agent:\n    pass\n")
+    (tmp_path / "agents").mkdir()
+    (tmp_path / "agents" / "other_agent.py").write_text("class Smart:\n    pass\n")
+    monkeypatch.chdir(tmp_path)
+    path = list(sys.path)
+
+    assert load_agent("cwd_agent").__name__ == "Agent"
+    assert load_agent("other_agent:Smart", directory="agents").__name__ == "Smart"
+    assert sys.path == path
+
+    (tmp_path / "first_agent.py").write_text("class Agent:\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))  # already on the path, as the script directory is
+    path = list(sys.path)
+    assert load_agent("first_agent").__name__ == "Agent"
+    assert sys.path == path  # left where it was
@@ -0,0 +1,72 @@
+import pytest
+import random
+from mapa import *
+
+
+def test_walls():
+    mapa = Map(level=5, size=(21, 15))
+    walls = mapa.walls
+    assert walls
+    assert all(mapa.get_tile(w) == Tiles.WALL and mapa.is_wall(w) for w in walls)
+    assert all(mapa.is_blocked(w) and not mapa.is_blocked(w, wallpass=True) for w in walls)
+
+    mapa.remove_wall(walls[0])
+    assert walls[0] not in mapa.walls
+    assert mapa.get_tile(walls[0]) == Tiles.PASSAGE
+    assert not mapa.is_blocked(walls[0])
+
+    mapa.walls = [[3, 3]]
+    assert mapa.walls == [(3, 3)]
+    assert not mapa.is_wall(walls[1])
+    assert mapa.is_wall((3, 3))
+
+
+def test_outside():
+    mapa = Map(size=(13, 13), empty=True)
+    for pos in [(-1, 1), (1, -1), (13, 1), (1, 13)]:
+        assert mapa.is_blocked(pos)
+        assert mapa.is_stone(pos)
+        assert not mapa.is_wall(pos)
+
+
+def test_distance_field():
+    mapa = Map(level=10, size=(21, 15), rng=random.Random(2))
+    field = mapa.distance_field([(1, 1)])
+    assert mapa.distance_field([(1, 1)]) is field
+    assert field[(1, 1)] == 0 and field[(2, 1)] == 1 and field[(3, 1)] == 2
+    assert (2, 2) not in field  # stone
+    assert all(w not in field for w in mapa.walls)
+
+    path = field.path((5, 1))
+    assert path == [(5, 1), (4, 1), (3, 1), (2, 1), (1, 1)]
+
+    wallpass = mapa.distance_field([(1, 1)], wallpass=True)
+    assert all(w in wallpass for w in mapa.walls)
+
+    # incremental updates match a fresh BFS
+    for wall in mapa.walls[:10]:
+        mapa.remove_wall(wall)
+    fresh = DistanceField(mapa, [(1, 1)])
+    assert field._dist == fresh._dist
+    assert wallpass._dist == DistanceField(mapa, [(1, 1)], wallpass=True)._dist
+
+
+def test_map_pool():
+    pool = MapPool(size=(21, 15), capacity=2)
+    a = pool.get(3, 42, 4)
+    b = pool.get(3, 42, 4)
+    assert (pool.hits, pool.misses) == (1, 1)
+    assert a is not b and a.map is b.map  # tiles are shared until written
+
+    fresh = Map(level=3, size=(21, 15), enemies=4, rng=random.Random(42))
+    assert a.walls == fresh.walls and a.map == fresh.map
+    assert a.enemies_spawn == fresh.enemies_spawn and a.exit_door == fresh.exit_door
+
+    wall = a.walls[0]
+    a.remove_wall(wall)
+    assert not a.is_wall(wall)
+    assert b.is_wall(wall) and pool.get(3, 42, 4).is_wall(wall)
+
+    pool.get(1, 1, 0)
+    pool.get(2, 1, 0)
+    assert len(pool) == 2 and (3, 42, 4) not in pool  # least recently used
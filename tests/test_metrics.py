@@ -0,0 +1,52 @@
+import pytest
+import asyncio
+
+import aiohttp
+
+from metrics import *
+
+
+def test_expose():
+    registry = Registry()
+    sent = registry.counter("sent_bytes_total", "Bytes sent", ["role"])
+    games = registry.counter("games_total", "Games")
+    registry.gauge("sessions", "Sessions", function=lambda: 3)
+    latency = registry.histogram("send_seconds", "Send time", ["role"], buckets=(0.1, 1))
+
+    sent.inc(10, role="player")
+    sent.inc(5, role='"viewer"')
+    latency.observe(0.05, role="player")
+    latency.observe(0.5, role="player")
+    latency.observe(5, role="player")
+    with pytest.raises(ValueError):
+        sent.inc(1)
+
+    lines = registry.expose().splitlines()
+    assert "# TYPE sent_bytes_total counter" in lines
+    assert 'sent_bytes_total{role="player"} 10' in lines
+    assert 'sent_bytes_total{role="\\"viewer\\""} 5' in lines
+    assert "games_total 0" in lines
+    assert "sessions 3" in lines
+    assert 'send_seconds_bucket{role="player",le="0.1"} 1' in lines
+    assert 'send_seconds_bucket{role="player",le="1.0"} 2' in lines
+    assert 'send_seconds_bucket{role="player",le="+Inf"} 3' in lines
+    assert 'send_seconds_sum{role="player"} 5.55' in lines
+    assert 'send_seconds_count{role="player"} 3' in lines
+
+
+def test_serve():
+    async def scrape():
+        registry = Registry()
+        registry.counter("games_total", "Games").inc()
+        runner = await serve(registry, "127.0.0.1", 0)
+        host, port = runner.addresses[0][:2]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{host}:{port}/metrics") as response:
+                body = await response.text()
+                content_type = response.headers["Content-Type"]
+        await runner.cleanup()
+        return body, content_type
+
+    body, content_type = asyncio.run(scrape())
+    assert "games_total 1" in body.splitlines()
+    assert content_type.startswith("text/plain; version=0.0.4")
@@ -0,0 +1,65 @@
+import pytest
+import json
+import random
+
+from game import Game
+from protocol import *
+
+
+def test_state():
+    rng = random.Random(5)
+    game = Game(level=9, timeout=300, seed=5)
+    game.start("Zé")
+    encoder = BinaryEncoder()
+
+    binary_size = json_size = 0
+    while game.running:
+        state = game.step(rng.choice("wasdBA"))
+        expected = json.loads(game.state)
+        decoded = loads(encoder.encode_state(state))
+
+        assert [e.pop("id") for e in decoded["enemies"]] == [encoder.enemy_id(e.pop("id")) for e in expected["enemies"]]
+        assert decoded == expected
+        binary_size += len(encoder.encode_state(state))
+        json_size += game.state_size
+
+    assert binary_size < json_size / 3
+
+
+def test_info():
+    game = Game(level=3, seed=1)
+    game.start("John Doe")
+    info = game.info()
+    info["highscores"] = [["John Doe", 1200], ["Zé", 0]]
+    info["session"] = 7
+
+    assert loads(BinaryEncoder().encode_info(info)) == json.loads(json.dumps(info))
+    assert loads(json.dumps({"score": 10})) == {"score": 10}
+
+
+def test_snapshot():
+    game = Game(level=2, seed=3)
+    game.start("John Doe")
+    encoder = BinaryEncoder()
+    assert "state" not in loads(encoder.encode_snapshot(game.snapshot()))
+
+    for key in "BddwwsssA":
+        game.step(key)
+    snapshot = loads(encoder.encode_snapshot(game.snapshot()))
+    assert snapshot["map"] == json.loads(json.dumps(game.map.map))
+    assert snapshot["state"]["step"] == 9
+    assert snapshot["state"]["walls"] == json.loads(json.dumps(game.map.walls))
+
+
+def test_out_of_range():
+    game = Game(level=2, seed=3)
+    game.start("John Doe")
+    state = game.step()
+    encoder = BinaryEncoder()
+
+    with pytest.raises(ValueError):
+        encoder.encode_state(dict(state, level=256))
+    with pytest.raises(ValueError):
+        encoder.encode_state(dict(state, bomberman=[300, 1]))
+    with pytest.raises(ValueError):
+        encoder.encode_info(dict(game.info(), size=[256, 31]))
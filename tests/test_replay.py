@@ -0,0 +1,47 @@
+import random
+
+import replay
+from game import Game
+
+
+def play_randomly(seed, timeout=300):
+    keys = random.Random(seed)
+    game = Game(level=2, lives=3, timeout=timeout)
+    game.start("John Doe")
+    while game.running:
+        game.step(keys.choice(["", "w", "a", "s", "d", "A", "B", "x"]))
+    return game
+
+
+def test_record_and_simulate(tmp_path):
+    game = play_randomly(7)
+    recorded = replay.record(game)
+    assert len(recorded["keys"]) == game.total_steps
+    assert set(recorded["keys"]) <= set("wasdAB.")
+
+    filename = tmp_path / "game.json"
+    replay.save(recorded, filename)
+    loaded = replay.load(filename)
+    assert replay.simulate(loaded) == recorded["result"]
+    assert replay.verify(loaded)
+
+    states = list(replay.states(loaded))
+    assert len(states) == game.total_steps
+    assert states[-1]["score"] == game.score
+
+
+def test_verify_mismatch():
+    recorded = replay.record(play_randomly(3, timeout=50))
+    recorded["result"]["score"] += 1
+    assert not replay.verify(recorded)
+
+
+def test_pathfinding_replay():
+    game = Game(level=14, timeout=60, pathfinding=True)
+    game.start("John Doe")
+    while game.running:
+        game.step("")
+    recorded = replay.record(game)
+    assert recorded["pathfinding"] is True
+    assert replay.new_game(recorded).pathfinding
+    assert replay.verify(recorded)
@@ -0,0 +1,274 @@
+import pytest
+import asyncio
+import json
+
+import game
+from delta import DeltaDecoder
+import server
+from server import Game_server, Player
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.closed = False
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append(json.loads(message))
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fast(monkeypatch, tmp_path):
+    monkeypatch.setattr(game, "GAME_SPEED", 1000)
+    monkeypatch.setattr(server, "HIGHSCORE_FILE", str(tmp_path / "highscores.json"))
+
+
+def test_sessions():
+    async def play():
+        g = Game_server(1, 3, 20, None, seed=1, max_sessions=2)
+        viewer = FakeWebSocket()
+        await g.watch(viewer)  # no session yet, waits for the next one
+        players = [FakeWebSocket() for _ in range(3)]
+        for i, ws in enumerate(players):
+            await g.players.put(Player(f"player{i}", ws))
+
+        mainloop = asyncio.ensure_future(g.mainloop())
+        await asyncio.sleep(0.01)
+        assert sorted(g.sessions) == [1, 2]  # third player waits for a free slot
+        assert g.watching[viewer] is g.sessions[1]
+
+        while not all(ws.closed for ws in players):
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return players, viewer
+
+    players, viewer = asyncio.run(play())
+    for ws in players:
+        assert "map" in ws.messages[0]
+        assert [m["step"] for m in ws.messages[1:-1]] == list(range(1, 21))
+        assert ws.messages[-1] == {"score": 0}
+    assert viewer.messages[0]["session"] == 1
+    assert [m["step"] for m in viewer.messages[1:21]] == list(range(1, 21))
+
+
+def test_viewers():
+    async def play():
+        g = Game_server(1, 3, 5, None, max_sessions=1)
+        players = [FakeWebSocket(), FakeWebSocket()]
+        for i, ws in enumerate(players):
+            await g.players.put(Player(f"player{i}", ws))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        await asyncio.sleep(0)
+
+        follower, watcher = FakeWebSocket(), FakeWebSocket()
+        await g.watch(follower)
+        await g.watch(watcher, 1)
+        query = _Commands([{"cmd": "sessions"}])
+        await g.incomming_handler(query, "/viewer")
+        assert [s["id"] for s in query.messages[0]["sessions"]] == [1]
+
+        while not all(ws.closed for ws in players):
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return follower, watcher
+
+    follower, watcher = asyncio.run(play())
+    assert [m.get("session") for m in follower.messages if "map" in m] == [1, 2]
+    assert [m.get("session") for m in watcher.messages if "map" in m] == [1]  # picked session 1
+
+
+def test_late_join_snapshot():
+    async def play():
+        g = Game_server(1, 3, 30, None, seed=2)
+        player = FakeWebSocket()
+        g._encodings[player] = "delta"
+        await g.players.put(Player("player", player))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        while 1 not in g.sessions or g.sessions[1].stats["frames"] < 10:
+            await asyncio.sleep(0)
+
+        session = g.sessions[1]
+        viewers = [FakeWebSocket() for _ in range(3)]
+        for ws in viewers:
+            g._encodings[ws] = "delta"
+            await g.watch(ws, 1)
+        assert session.snapshot("delta") is session.snapshot("delta")
+        while not player.closed:
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return player, viewers
+
+    player, viewers = asyncio.run(play())
+    played = DeltaDecoder()
+    played = [played.apply(m) for m in player.messages]
+    for ws in viewers:
+        snapshot = ws.messages[0]
+        assert snapshot["session"] == 1
+        assert snapshot["state"] in played
+        decoder = DeltaDecoder()
+        decoder.apply(snapshot)
+        # deltas continue from the snapshot, no keyframe needed
+        assert ws.messages[1]["frame"] == "delta"
+        states = [decoder.apply(m) for m in ws.messages[1:]]
+        assert states == played[-len(states) - 1 : -1]
+
+
+def test_json_only_when_asked():
+    async def play():
+        g = Game_server(1, 3, 10, None, seed=1)
+        player = FakeWebSocket()
+        g._encodings[player] = "delta"
+        await g.players.put(Player("player", player))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        while 1 not in g.sessions:
+            await asyncio.sleep(0)
+        game = g.sessions[1].game
+        while not player.closed:
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return game, player
+
+    game, player = asyncio.run(play())
+    assert len(player.messages) == 12
+    assert game.state_encode_time == 0  # no one asked for JSON states
+
+
+def test_delta_viewer_join():
+    async def play():
+        g = Game_server(1, 3, 40, None, seed=2)
+        player = FakeWebSocket()  # json, the delta encoder only runs for the viewers
+        await g.players.put(Player("player", player))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        viewers = [FakeWebSocket(), FakeWebSocket()]
+        for ws, frame in zip(viewers, (10, 20)):
+            while 1 not in g.sessions or g.sessions[1].stats["frames"] < frame:
+                await asyncio.sleep(0)
+            g._encodings[ws] = "delta"
+            await g.watch(ws, 1)
+        while not player.closed:
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return player, viewers
+
+    player, (first, second) = asyncio.run(play())
+    # the first delta viewer needs a keyframe, the second continues from the snapshot
+    assert [m.get("frame") for m in first.messages[1:3]] == ["key", "delta"]
+    assert all(m.get("frame") == "delta" for m in first.messages[3:-1])
+    assert second.messages[1]["frame"] == "delta"
+    for ws in (first, second):
+        decoder = DeltaDecoder()
+        states = [decoder.apply(m) for m in ws.messages]
+        assert states[1:] == player.messages[-len(states) : -1]
+
+
+class SlowWebSocket(FakeWebSocket):
+    """Viewer that never gets its frames through."""
+
+    async def send(self, message):
+        await asyncio.sleep(3600)
+
+
+def test_slow_viewers():
+    async def play():
+        g = Game_server(1, 3, 100, None, seed=1)
+        player, slow, sparse, sparse_delta = (
+            FakeWebSocket(), SlowWebSocket(), FakeWebSocket(), FakeWebSocket()
+        )
+        g._encodings[sparse_delta] = "delta"
+        await g.watch(slow)
+        await g.watch(sparse, fps=game.GAME_SPEED / 2)
+        await g.watch(sparse_delta, fps=game.GAME_SPEED / 2)
+        await g.players.put(Player("player", player))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        while not player.closed:
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return g, player, slow, sparse, sparse_delta
+
+    g, player, slow, sparse, sparse_delta = asyncio.run(play())
+    assert len(player.messages) == 102  # the tick never waited for the slow viewer
+    assert slow.closed and slow not in g.viewers  # evicted
+    assert [m["step"] for m in sparse.messages[1:]] == list(range(2, 101, 2))
+    # deltas from the last frame sent, not a keyframe every time
+    assert sparse_delta.messages[1]["frame"] == "key"
+    assert [m["base"] for m in sparse_delta.messages[2:]] == list(range(2, 99, 2))
+    decoder = DeltaDecoder()
+    assert [decoder.apply(m) for m in sparse_delta.messages[1:]] == sparse.messages[1:]
+
+    metrics = g.metrics.expose().splitlines()
+    assert "bomberman_games_completed_total 1" in metrics
+    assert "bomberman_tick_duration_seconds_count 100" in metrics
+    assert 'bomberman_send_seconds_count{role="player"} 102' in metrics
+    assert "bomberman_viewer_evictions_total 1" in metrics
+
+
+class StuckWebSocket(FakeWebSocket):
+    """Viewer whose frames only get through once it is released."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = asyncio.Event()
+
+    async def send(self, message):
+        await self.released.wait()
+        await super().send(message)
+
+
+def test_viewer_overflow():
+    async def play():
+        g = Game_server(1, 3, 60, None, seed=2)
+        player, stuck = FakeWebSocket(), StuckWebSocket()
+        g._encodings[player] = g._encodings[stuck] = "delta"
+        await g.players.put(Player("player", player))
+        mainloop = asyncio.ensure_future(g.mainloop())
+        while 1 not in g.sessions or g.sessions[1].stats["frames"] < 5:
+            await asyncio.sleep(0)
+        await g.watch(stuck, 1)
+        viewer = g.viewers[stuck]
+        while g.sessions[1].stats["frames"] < 5 + server.VIEWER_QUEUE:
+            await asyncio.sleep(0)  # the snapshot is stuck, the frames pile up
+        viewer.send(json.dumps({"info": True}))  # never dropped
+        while viewer.dropped == 0:
+            await asyncio.sleep(0)
+        assert viewer.dropped == server.VIEWER_QUEUE
+        stuck.released.set()
+        while not player.closed:
+            await asyncio.sleep(0.01)
+        mainloop.cancel()
+        return player, stuck
+
+    player, stuck = asyncio.run(play())
+    played = DeltaDecoder()
+    played = [played.apply(m) for m in player.messages]
+    assert "map" in stuck.messages[0]
+    assert {"info": True} in stuck.messages
+    decoder = DeltaDecoder()
+    states = [decoder.apply(m) for m in stuck.messages if m.get("frame") or "map" in m]
+    # the first frame after the overflow builds on the snapshot
+    assert [m.get("base") for m in stuck.messages if m.get("frame")][0] == 5
+    assert states[1:] == played[-len(states) : -1]
+
+
+class _Commands(FakeWebSocket):
+    """Connection that sends the given commands and hangs up."""
+
+    def __init__(self, commands):
+        super().__init__()
+        self._commands = [json.dumps(c) for c in commands]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._commands:
+            raise StopAsyncIteration
+        return self._commands.pop(0)
+
+
+def test_message_size():
+    message = json.dumps({"player": "José"})
+    assert server.message_size(message) == len(message.encode())  # bytes on the wire
+    assert server.message_size(b"\x01\x02") == 2
@@ -0,0 +1,148 @@
+import pytest
+import asyncio
+import json
+import os
+
+from aiohttp import web
+
+from spool import GradingSpool
+
+
+class Grading:
+    """Stand-in for prof/grading.py, failing with the given statuses first."""
+
+    def __init__(self, failures=(), bad=None):
+        self.failures = list(failures)
+        self.bad = bad  # player whose results always fail
+        self.requests = []
+        self.games = []
+
+    async def add_game(self, request):
+        games = await request.json()
+        self.requests.append(games)
+        if self.failures:
+            return web.Response(status=self.failures.pop(0))
+        if self.bad and self.bad in json.dumps(games):
+            return web.Response(status=500)
+        self.games.extend(games if isinstance(games, list) else [games])
+        return web.json_response(games)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/game", self.add_game)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/game"
+
+
+def result(n):
+    return {"player": f"player{n}", "score": n, "total_steps": 10 * n, "level": 1}
+
+
+def test_batches_and_retries(tmp_path):
+    async def run():
+        grading = Grading(failures=[503, 503])
+        spool = GradingSpool(await grading.start(), str(tmp_path), batch=20, backoff=0.01)
+        for n in range(3):
+            spool.submit(result(n))
+        assert spool.pending == 3
+        await spool.flush()
+        spool.start()
+        await spool.close(timeout=2)
+
+        spool.submit(result(3))  # not started, stays in the spool
+        await spool.close()
+        await grading.runner.cleanup()
+        return grading, spool
+
+    grading, spool = asyncio.run(run())
+    assert len(grading.requests) == 3  # retried twice, sent together
+    assert grading.games == [result(n) for n in range(3)]
+    assert spool.sent == 3
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_restart(tmp_path):
+    async def run():
+        down = GradingSpool("http://127.0.0.1:1/game", str(tmp_path), backoff=0.01)
+        down.start()
+        for n in range(3):
+            down.submit(result(n))
+        await down.close(timeout=0.2)  # grading server down, results kept
+
+        grading = Grading()
+        spool = GradingSpool(await grading.start(), str(tmp_path), batch=2)
+        assert spool.pending == 3
+        await spool.flush()
+        spool.start()
+        await spool.close(timeout=2)
+        await grading.runner.cleanup()
+        return grading
+
+    grading = asyncio.run(run())
+    assert grading.requests == [[result(0), result(1)], result(2)]
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejected(tmp_path):
+    async def run():
+        grading = Grading(failures=[400])
+        spool = GradingSpool(await grading.start(), str(tmp_path), backoff=0.01)
+        spool.start()
+        spool.submit(result(1))
+        await spool.close(timeout=2)
+        await grading.runner.cleanup()
+        return grading, spool
+
+    grading, spool = asyncio.run(run())
+    assert len(grading.requests) == 1  # not retried
+    assert spool.rejected == 1
+    assert [name.endswith(".rejected") for name in os.listdir(tmp_path)] == [True]
+
+
+def test_bad_result(tmp_path):
+    async def run():
+        grading = Grading(bad="player2")
+        spool = GradingSpool(
+            await grading.start(), str(tmp_path), batch=4, backoff=0.001, max_attempts=2
+        )
+        for n in range(4):
+            spool.submit(result(n))
+        await spool.flush()
+        spool.start()
+        await spool.close(timeout=2)
+        await grading.runner.cleanup()
+        return grading, spool
+
+    grading, spool = asyncio.run(run())
+    # split in halves until the bad result is alone, the others go through
+    assert sorted(g["score"] for g in grading.games) == [0, 1, 3]
+    assert (spool.sent, spool.rejected) == (3, 1)
+    assert len(grading.requests) == 2 + 1 + 2 + 2 + 1  # all 4 twice, 0-1, 2-3 twice, 2 twice, 3
+    assert [name.endswith(".rejected") for name in os.listdir(tmp_path)] == [True]
+
+
+@pytest.mark.parametrize("spooled", [False, True])
+def test_queue_full(tmp_path, spooled):
+    async def run():
+        grading = Grading()
+        spool = GradingSpool(await grading.start(), str(tmp_path) if spooled else None, queue_size=2)
+        for n in range(3):
+            spool.submit(result(n))
+        await spool.flush()
+        pending = spool.pending
+        spool.start()
+        await spool.close(timeout=2)
+        await grading.runner.cleanup()
+        return grading, spool, pending
+
+    grading, spool, pending = asyncio.run(run())
+    assert pending == (3 if spooled else 2)  # counting the one left in the spool
+    if spooled:  # the last one waits in the spool until there is room
+        assert grading.games == [result(0), result(1), result(2)]
+    else:
+        assert grading.games == [result(0), result(1)]
+        assert spool.dropped == 1
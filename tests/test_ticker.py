@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+
+from ticker import Ticker
+
+
+class Clock:
+    """Fake time, only moved by sleep() and the work done between ticks."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+def run(ticker, clock, work):
+    """Time each tick started at, work[i] seconds are spent after tick i."""
+
+    async def ticks():
+        started = []
+        for seconds in work:
+            await ticker.wait()
+            started.append(clock.now)
+            clock.now += seconds
+        return started
+
+    return asyncio.run(ticks())
+
+
+def test_no_drift():
+    clock = Clock()
+    ticker = Ticker(8, clock=clock, sleep=clock.sleep)
+    started = run(ticker, clock, [0.0625] * 50)  # half of every period is work
+    assert started == [n * 0.125 for n in range(1, 51)]  # and not n * 0.1875
+    assert ticker.ticks == 50 and ticker.skipped == 0
+    assert ticker.max_lateness == 0
+
+
+@pytest.mark.parametrize("catch_up", [4, 10])
+def test_overrun(catch_up):
+    clock = Clock()
+    ticker = Ticker(8, catch_up, clock=clock, sleep=clock.sleep)
+    started = run(ticker, clock, [0.6875] + [0] * 6)  # tick 2 is late, 4 more are due
+    assert ticker.skipped == 0
+    assert started == [0.125] + [0.8125] * 5 + [0.875]  # late ticks ran back to back
+    assert ticker.max_lateness == 0.8125 - 0.25
+
+
+def test_skip():
+    clock = Clock()
+    ticker = Ticker(8, 3, clock=clock, sleep=clock.sleep)
+    started = run(ticker, clock, [0.6875] + [0] * 3)
+    assert ticker.skipped == 4  # due after the late tick 2, more than catch_up
+    assert started == [0.125, 0.8125, 0.9375, 1.0625]  # back on schedule right away
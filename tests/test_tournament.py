@@ -0,0 +1,37 @@
+import pytest
+from tournament import run_job, tournament
+
+
+class Idle:
+    def __init__(self, game_info):
+        pass
+
+    def __call__(self, state):
+        return ""
+
+
+class Crash:
+    def __init__(self, game_info):
+        raise RuntimeError("crashed")
+
+
+def test_reproducible():
+    assert run_job("test_tournament:Idle", 7, 2, timeout=100) == run_job("test_tournament:Idle", 7, 2, timeout=100)
+
+
+def test_tournament():
+    results = list(tournament(["test_tournament:Idle"], [1, 2], [1, 3], timeout=20, workers=2))
+    assert len(results) == 4
+    assert {(r["seed"], r["start_level"]) for r in results} == {(1, 1), (1, 3), (2, 1), (2, 3)}
+    assert all(r["player"] == "test_tournament:Idle" for r in results)
+    assert all(set(r) >= {"player", "level", "score", "total_steps"} for r in results)
+
+
+def test_crashing_agent():
+    agents = ["test_tournament:Idle", "test_tournament:Crash"]
+    results = list(tournament(agents, [1, 2], [1], timeout=20, workers=2))
+    assert len(results) == 4  # the other games went on
+    failed = sorted((r["seed"], r["start_level"]) for r in results if "error" in r)
+    assert failed == [(1, 1), (2, 1)]
+    assert all(r["player"] == "test_tournament:Crash" for r in results if "error" in r)
+    assert all("crashed" in r["error"] for r in results if "error" in r)
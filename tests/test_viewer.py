@@ -0,0 +1,141 @@
+import pytest
+import asyncio
+import os
+import time
+
+from viewer import Mailbox
+
+
+def states(steps, level=1, timeout=100, lives=3):
+    return [{"step": s, "level": level, "lives": lives, "timeout": timeout} for s in steps]
+
+
+def test_mailbox_keeps_latest_state():
+    mailbox = Mailbox()
+    mailbox.put_nowait({"map": [], "timeout": 100})
+    for state in states(range(1, 50)):
+        mailbox.put_nowait(state)
+    assert len(mailbox) == 3
+
+    assert "map" in mailbox.get_nowait()
+    assert mailbox.get_nowait()["step"] == 1  # first state of the level
+    assert mailbox.get_nowait()["step"] == 49
+    assert mailbox.get_nowait() is None
+    assert mailbox.dropped == 47
+
+
+def test_mailbox_keeps_events():
+    mailbox = Mailbox()
+    mailbox.put_nowait({"map": [], "timeout": 100})
+    for state in states(range(1, 10)) + states(range(1, 10), level=2) + states([10], level=2, lives=0):
+        mailbox.put_nowait(state)
+    mailbox.put_nowait({"map": [], "timeout": 100})
+    mailbox.put_nowait(states([1])[0])
+
+    messages = []
+    while len(mailbox):
+        messages.append(mailbox.get_nowait())
+    assert [(m.get("level"), m.get("step")) for m in messages] == [
+        (None, None),
+        (1, 1),
+        (2, 1),
+        (2, 10),  # game over
+        (None, None),
+        (1, 1),
+    ]
+
+
+def test_mailbox_skips_stale_level_changes():
+    mailbox = Mailbox(max_staleness=0.01)
+    mailbox.put_nowait({"map": [], "timeout": 100})
+    mailbox.put_nowait(states([1], level=1)[0])
+    mailbox.put_nowait(states([1], level=2)[0])
+    time.sleep(0.02)
+    mailbox.put_nowait(states([2], level=2)[0])
+
+    assert "map" in mailbox.get_nowait()
+    assert mailbox.get_nowait()["step"] == 2
+    assert mailbox.lag < 0.01
+
+
+def test_mailbox_drops_oldest_events():
+    mailbox = Mailbox(max_events=2)
+    for level in range(1, 5):
+        mailbox.put_nowait(states([1], level=level)[0])
+    assert len(mailbox) == 2
+    assert mailbox.dropped == 2
+    assert [mailbox.get_nowait()["level"] for _ in range(2)] == [3, 4]
+
+
+def test_mailbox_get_waits():
+    async def run():
+        mailbox = Mailbox()
+        getter = asyncio.ensure_future(mailbox.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        for state in states(range(1, 4)):
+            mailbox.put_nowait(state)
+        first = await getter
+        return first, await mailbox.get(), mailbox.get_nowait()
+
+    first, latest, empty = asyncio.run(run())
+    assert (first["step"], latest["step"], empty) == (1, 3, None)
+
+
+def test_scene_update():
+    import pygame
+    import render
+    from game import Game
+    from viewer import scale
+
+    game = Game(level=2, seed=4, timeout=100)
+    game.start("John Doe")
+    renderer = render.Renderer(dict(game.info(), highscores=[]))
+    scene = renderer.scene
+    state = game.step()
+    scene.update(state)
+    scene.draw()
+    assert set(scene.enemies) == {enemy["id"] for enemy in state["enemies"]}
+    assert scene.walls == {tuple(wall) for wall in state["walls"]}
+
+    def cell(pos):
+        area = renderer.surface.subsurface(pygame.Rect(scale(pos), scale((1, 1))))
+        return pygame.image.tobytes(area, "RGB")
+
+    scene.update(state)
+    redrawn = scene.draw()
+    assert scale((2, 1)) not in [rect.topleft for rect in redrawn]
+
+    wall = tuple(state["walls"][0])
+    assert cell(wall) != cell((3, 1))
+    enemy = state["enemies"][0]
+    changed = dict(
+        state,
+        bomberman=[2, 1],
+        walls=state["walls"][1:],
+        enemies=state["enemies"][1:],
+        bombs=[[[1, 1], 10, 3]],
+    )
+    scene.update(changed)
+    redrawn = [rect.topleft for rect in scene.draw()]
+    assert scale((2, 1)) in redrawn and scale(wall) in redrawn
+    assert enemy["id"] not in scene.enemies
+    assert list(scene.bombs) == [(1, 1)]
+    assert wall not in scene.walls
+    assert cell(wall) == cell((3, 1))  # a passage again
+
+
+def test_render(tmp_path):
+    import render
+    import replay
+    from game import Game
+
+    game = Game(level=2, seed=1, timeout=30)
+    game.start("John Doe")
+    for key in "BddssA" * 5:
+        game.step(key)
+    replay.save(replay.record(game), tmp_path / "game.json")
+
+    info, states = render.from_replay(tmp_path / "game.json")
+    assert render.render(info, states, str(tmp_path / "frames"), every=2) == 15
+    assert sorted(os.listdir(tmp_path / "frames"))[-1] == "00015.png"
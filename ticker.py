@@ -0,0 +1,70 @@
+import asyncio
+import math
+
+MAX_CATCH_UP = 5  # late ticks run back to back, more than this are skipped
+
+
+class Ticker:
+    """Fixed timestep clock aiming at absolute deadlines start + n * period.
+
+    Time spent between ticks (simulation, encoding, sends) doesn't push the
+    following deadlines back, so the tick rate doesn't drift. After an
+    overrun the ticks already due run back to back to catch up, unless more
+    than catch_up are due: those are skipped and the schedule restarts.
+    Lateness (how long after its deadline each tick started) is measured
+    for jitter reports. clock and sleep default to the event loop's."""
+
+    def __init__(self, fps, catch_up=MAX_CATCH_UP, clock=None, sleep=asyncio.sleep):
+        self.period = 1.0 / fps
+        self.catch_up = catch_up
+        self._clock = clock
+        self._sleep = sleep
+        self.ticks = 0
+        self.skipped = 0
+        self.lateness = 0.0  # of the last tick, in seconds
+        self.max_lateness = 0.0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._deadline = None
+
+    async def wait(self):
+        """Sleep until the next tick is due."""
+        clock = self._clock or asyncio.get_event_loop().time
+        if self._deadline is None:
+            self._deadline = clock() + self.period
+        delay = self._deadline - clock()
+        await self._sleep(max(0, delay))  # even when late, let others run
+
+        now = clock()
+        self.lateness = now - self._deadline
+        self.ticks += 1
+        self.max_lateness = max(self.max_lateness, self.lateness)
+        self._sum += self.lateness
+        self._sum_squares += self.lateness ** 2
+
+        self._deadline += self.period
+        due = math.floor((now - self._deadline) / self.period) + 1  # deadlines already past
+        if due > self.catch_up:
+            self.skipped += due
+            self._deadline = now + self.period
+
+    @property
+    def mean_lateness(self):
+        return self._sum / self.ticks if self.ticks else 0.0
+
+    @property
+    def jitter(self):
+        """Standard deviation of the lateness, in seconds."""
+        if not self.ticks:
+            return 0.0
+        variance = self._sum_squares / self.ticks - self.mean_lateness ** 2
+        return math.sqrt(max(0.0, variance))
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "mean_lateness": self.mean_lateness,
+            "max_lateness": self.max_lateness,
+            "jitter": self.jitter,
+        }
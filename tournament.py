@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from game import LEVEL_ENEMIES, LIVES, MAP_SIZE, TIMEOUT
+from headless import load_agent, play, quiet
+from mapa import MapPool
+
+MAP_POOL = MapPool(MAP_SIZE)  # one per worker process, filled as games need maps
+
+
+def init_worker(capacity):
+    MAP_POOL.capacity = capacity
+
+
+def run_job(agent, seed, level, lives=LIVES, timeout=TIMEOUT):
+    """Play one game of agent ("module:attribute") on the map seed from level."""
+    result = play(
+        load_agent(agent),
+        player=agent,
+        level=level,
+        lives=lives,
+        timeout=timeout,
+        seed=seed,
+        map_pool=MAP_POOL,
+    )
+    result["seed"] = seed
+    result["start_level"] = level
+    return result
+
+
+def tournament(agents, seeds, levels, lives=LIVES, timeout=TIMEOUT, workers=None):
+    """Play every agent x seed x starting level in a process pool.
+
+    Results are yielded as soon as each game finishes, in the record format
+    accepted by the grading server plus the seed and start_level. A game
+    whose agent raised yields player, seed, start_level and the "error"
+    instead, the other games go on."""
+    # every agent plays the same maps: each worker keeps the maps of the games
+    # it played, a later game on the same seed and starting level reuses them
+    # if it runs on that worker. The maps of a level depend on the level the
+    # game started from, a seed takes one map per level from each start on.
+    capacity = max(
+        MAP_POOL.capacity,
+        len(seeds) * sum(sum(l >= start for l in LEVEL_ENEMIES) for start in levels),
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(capacity,)
+    ) as pool:
+        jobs = {
+            pool.submit(run_job, agent, seed, level, lives, timeout): (agent, seed, level)
+            for seed in seeds
+            for level in levels
+            for agent in agents
+        }
+        for job in as_completed(jobs):
+            try:
+                yield job.result()
+            except Exception as e:
+                agent, seed, level = jobs[job]
+                yield {"player": agent, "seed": seed, "start_level": level, "error": repr(e)}
+
+
+if __name__ == "__main__":
+    quiet()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("agents", help="agent factories as module:attribute", nargs="+")
+    parser.add_argument("--seeds", help="map seeds", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--levels", help="starting levels", type=int, nargs="+", default=list(LEVEL_ENEMIES)
+    )
+    parser.add_argument("--lives", help="Number of lives", type=int, default=LIVES)
+    parser.add_argument(
+        "--timeout", help="Timeout after this amount of steps", type=int, default=TIMEOUT
+    )
+    parser.add_argument("--workers", help="number of processes", type=int, default=None)
+    args = parser.parse_args()
+
+    # one grading record (or error) per line on stdout, a summary per agent on stderr
+    results = []
+    for result in tournament(
+        args.agents, args.seeds, args.levels, args.lives, args.timeout, args.workers
+    ):
+        print(json.dumps(result), flush=True)
+        results.append(result)
+
+    print(
+        f"{'player':30} {'games':>5} {'errors':>6} {'score':>8} {'level':>6} {'steps':>6}",
+        file=sys.stderr,
+    )
+    for agent in args.agents:
+        games = [r for r in results if r["player"] == agent and "error" not in r]
+        errors = sum(r["player"] == agent and "error" in r for r in results)
+        played = max(1, len(games))
+        print(
+            f"{agent:30} {len(games):5d} {errors:6d} {sum(r['score'] for r in games):8d}"
+            f" {sum(r['level'] for r in games) / played:6.1f}"
+            f" {sum(r['total_steps'] for r in games) / played:6.0f}",
+            file=sys.stderr,
+        )
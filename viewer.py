@@ -2,6 +2,7 @@ import os
 import asyncio
 import pygame
 import random
+import functools
 from functools import partial
 import json
 import asyncio
@@ -9,6 +10,9 @@ import websockets
 import logging
 import argparse
 import time
+from collections import deque
+from delta import DeltaDecoder
+from protocol import ENCODINGS, loads
 from mapa import Map, Tiles
 
 logging.basicConfig(level=logging.DEBUG)
@@ -122,28 +126,184 @@ RANKS = {
 }
 
 SPRITES = None
+MAX_STALENESS = 1.0  # seconds a level change can wait to be drawn before it is skipped
+MAX_EVENTS = 32  # messages the mailbox keeps besides the latest state
+
+
+def game_over(state, timeout):
+    return (
+        ("lives" in state and state["lives"] == 0)
+        or ("step" in state and state["step"] >= timeout)
+        or (
+            "bomberman" in state
+            and "exit" in state
+            and state["bomberman"] == state["exit"]
+            and "enemies" in state
+            and state["enemies"] == []
+        )
+    )
+
+
+class Mailbox:
+    """Latest state mailbox between the websocket and the render loop.
+
+    A viewer that can't draw every frame only draws the newest state, the
+    states in between are dropped. Game info, level changes and game over
+    are kept in order (up to max_events), a level change that waited more
+    than max_staleness seconds is skipped as well."""
+
+    def __init__(self, max_staleness=MAX_STALENESS, max_events=MAX_EVENTS):
+        self.max_staleness = max_staleness
+        self.dropped = 0  # messages never drawn
+        self.lag = 0.0  # seconds the last message waited to be drawn
+        self._events = deque(maxlen=max_events)
+        self._latest = None
+        self._timeout = None
+        self._level = None
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._events) + (self._latest is not None)
+
+    def put_nowait(self, message):
+        now = time.monotonic()
+        if "step" not in message:
+            if "timeout" in message:  # game info, a new game starts
+                self._timeout = message["timeout"]
+                self._level = None
+            kept = True
+        elif self._timeout is not None and game_over(message, self._timeout):
+            kept = True
+        elif message.get("level") != self._level:
+            self._level = message.get("level")
+            kept = None  # kept unless stale
+        else:
+            kept = False
+
+        if self._latest is not None:
+            self.dropped += 1
+            self._latest = None
+        if kept is False:
+            self._latest = (now, message)
+        else:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append((now, message, kept))
+        self._ready.set()
+
+    def get_nowait(self):
+        """Next message to draw, None if there is none."""
+        now = time.monotonic()
+        while self._events:
+            received, message, kept = self._events.popleft()
+            if kept or now - received <= self.max_staleness:
+                break
+            self.dropped += 1
+        else:
+            if self._latest is None:
+                self._ready.clear()
+                return None
+            (received, message), self._latest = self._latest, None
+        self.lag = now - received
+        return message
+
+    async def get(self):
+        while True:
+            message = self.get_nowait()
+            if message is not None:
+                return message
+            await self._ready.wait()
 
 
-async def messages_handler(ws_path, queue):
+async def messages_handler(ws_path, queue, encoding="json", session=None, fps=None):
     async with websockets.connect(ws_path) as websocket:
-        await websocket.send(json.dumps({"cmd": "join"}))
+        await websocket.send(
+            json.dumps({"cmd": "join", "encoding": encoding, "session": session, "fps": fps})
+        )
+        decoder = DeltaDecoder()
 
         while True:
             r = await websocket.recv()
-            queue.put_nowait(r)
+            message = decoder.apply(loads(r))
+            queue.put_nowait(message)
+            if "map" in message and "state" in message:
+                queue.put_nowait(message["state"])  # joined mid game, draw it as it is now
 
 
 class GameOver(BaseException):
     pass
 
 
-class Artifact(pygame.sprite.Sprite):
+@functools.lru_cache(maxsize=None)
+def tile(sheet, area):
+    """Sprite of the sheet area, composed once and shared by every sprite showing it."""
+    image = pygame.Surface(CHAR_SIZE)
+    image.fill((0, 0, 230))
+    image.blit(sheet, (0, 0), area)
+    return image
+
+
+@functools.lru_cache(maxsize=None)
+def explosion(sheet, radius):
+    """Image of a blast of radius, centered on the bomb."""
+    image = pygame.Surface(
+        (
+            radius * 2 * CHAR_LENGTH + CHAR_LENGTH,
+            radius * 2 * CHAR_LENGTH + CHAR_LENGTH,
+        )
+    )
+    image.set_colorkey((0,0,0))
+    image.blit(
+        sheet,
+        scale((radius, radius)),
+        (*EXPLOSION["c"], *scale((1, 1))),
+    )
+    for r in range(1, radius):
+        image.blit(
+            sheet,
+            scale((radius - r, radius)),
+            (*EXPLOSION["l"], *scale((1, 1))),
+        )
+        image.blit(
+            sheet,
+            scale((radius + r, radius)),
+            (*EXPLOSION["r"], *scale((1, 1))),
+        )
+        image.blit(
+            sheet,
+            scale((radius, radius - r)),
+            (*EXPLOSION["u"], *scale((1, 1))),
+        )
+        image.blit(
+            sheet,
+            scale((radius, radius + r)),
+            (*EXPLOSION["d"], *scale((1, 1))),
+        )
+    image.blit(
+        sheet, scale((0, radius)), (*EXPLOSION["xl"], *scale((1, 1)))
+    )
+    image.blit(
+        sheet,
+        scale((2 * radius, radius)),
+        (*EXPLOSION["xr"], *scale((1, 1))),
+    )
+    image.blit(
+        sheet, scale((radius, 0)), (*EXPLOSION["xu"], *scale((1, 1)))
+    )
+    image.blit(
+        sheet,
+        scale((radius, 2 * radius)),
+        (*EXPLOSION["xd"], *scale((1, 1))),
+    )
+    return image
+
+
+class Artifact(pygame.sprite.DirtySprite):
     def __init__(self, *args, **kw):
         self.x, self.y = None, None  # postpone to update_sprite()
 
         x, y = kw.pop("pos", ((kw.pop("x", 0), kw.pop("y", 0))))
         new_pos = scale((x, y))
-        self.image = pygame.Surface(CHAR_SIZE)
         self.rect = pygame.Rect(new_pos + CHAR_SIZE)
         self.update_sprite((x, y))
         super().__init__()
@@ -154,10 +314,11 @@ class Artifact(pygame.sprite.Sprite):
         else:
             pos = scale(pos)
         self.rect = pygame.Rect(pos + CHAR_SIZE)
-        self.image.fill((0, 0, 230))
-        self.image.blit(*self.sprite)
+        sheet, _, area = self.sprite
+        self.image = tile(sheet, tuple(area))
         # self.image = pygame.transform.scale(self.image, scale((1, 1)))
         self.x, self.y = pos
+        self.dirty = 1
 
     def update(self, *args):
         self.update_sprite()
@@ -234,69 +395,19 @@ class Bomb(Artifact):
                 self.index = (self.index + 1) % len(BOMB)
                 self.sprite = (SPRITES, (0, 0), (*BOMB[self.index], *scale((1, 1))))
                 self.update_sprite()
-        if self.timeout == 0:
-            self.exploded = True
-            self.sprite = ()
+        if self.timeout == 0 and not self.exploded:
+            self.explode()
 
-            self.rect.inflate_ip(
-                self.radius * 2 * CHAR_LENGTH, self.radius * 2 * CHAR_LENGTH
-            )
+    def explode(self):
+        self.exploded = True
+        self.sprite = ()
+        self.dirty = 1
 
-            self.image = pygame.Surface(
-                (
-                    self.radius * 2 * CHAR_LENGTH + CHAR_LENGTH,
-                    self.radius * 2 * CHAR_LENGTH + CHAR_LENGTH,
-                )
-            )
-            self.image.set_colorkey((0,0,0))
-            self.image.blit(
-                SPRITES,
-                scale((self.radius, self.radius)),
-                (*EXPLOSION["c"], *scale((1, 1))),
-            )
-            for r in range(1, self.radius):
-                self.image.blit(
-                    SPRITES,
-                    scale((self.radius - r, self.radius)),
-                    (*EXPLOSION["l"], *scale((1, 1))),
-                )
-                self.image.blit(
-                    SPRITES,
-                    scale((self.radius + r, self.radius)),
-                    (*EXPLOSION["r"], *scale((1, 1))),
-                )
-                self.image.blit(
-                    SPRITES,
-                    scale((self.radius, self.radius - r)),
-                    (*EXPLOSION["u"], *scale((1, 1))),
-                )
-                self.image.blit(
-                    SPRITES,
-                    scale((self.radius, self.radius + r)),
-                    (*EXPLOSION["d"], *scale((1, 1))),
-                )
-            self.image.blit(
-                SPRITES, scale((0, self.radius)), (*EXPLOSION["xl"], *scale((1, 1)))
-            )
-            self.image.blit(
-                SPRITES,
-                scale((2 * self.radius, self.radius)),
-                (*EXPLOSION["xr"], *scale((1, 1))),
-            )
-            self.image.blit(
-                SPRITES, scale((self.radius, 0)), (*EXPLOSION["xu"], *scale((1, 1)))
-            )
-            self.image.blit(
-                SPRITES,
-                scale((self.radius, 2 * self.radius)),
-                (*EXPLOSION["xd"], *scale((1, 1))),
-            )
+        self.rect.inflate_ip(
+            self.radius * 2 * CHAR_LENGTH, self.radius * 2 * CHAR_LENGTH
+        )
 
-
-class Wall(Artifact):
-    def __init__(self, *args, **kw):
-        self.sprite = (SPRITES, (0, 0), (*WALL, *scale((1, 1))))
-        super().__init__(*args, **kw)
+        self.image = explosion(SPRITES, self.radius)
 
 
 class Exit(Artifact):
@@ -334,8 +445,13 @@ def draw_background(mapa):
     return background
 
 
+@functools.lru_cache()
+def font(size):
+    return pygame.font.Font(None, size)
+
+
 def draw_info(SCREEN, text, pos, color=(0, 0, 0), background=None):
-    myfont = pygame.font.Font(None, int(22 / SCALE))
+    myfont = font(int(22 / SCALE))
     textsurface = myfont.render(text, True, color, background)
 
     x, y = pos
@@ -354,44 +470,131 @@ def draw_info(SCREEN, text, pos, color=(0, 0, 0), background=None):
     return textsurface.get_width(), textsurface.get_height()
 
 async def main_loop(q):
-    while True:
-        await main_game()
-
-
-async def main_game():
-    global SPRITES, SCREEN
-
-    main_group = pygame.sprite.LayeredUpdates()
-    bombs_group = pygame.sprite.OrderedUpdates()
-    enemies_group = pygame.sprite.OrderedUpdates()
-    walls_group = pygame.sprite.OrderedUpdates()
-
     logging.info("Waiting for map information from server")
-    state = await q.get()  # first state message includes map information
-    logging.debug("Initial game status: %s", state)
-    newgame_json = json.loads(state)
-
-    GAME_SPEED = newgame_json["fps"]
-    mapa = Map(size=newgame_json["size"], mapa=newgame_json["map"])
-    TIMEOUT = newgame_json["timeout"]
-    SCREEN = pygame.display.set_mode(scale(mapa.size))
-    SPRITES = pygame.image.load("data/nes.png").convert_alpha()
-
-    BACKGROUND = draw_background(mapa)
-    SCREEN.blit(BACKGROUND, (0, 0))
-    main_group.add(BomberMan(pos=mapa.bomberman_spawn))
-
-    state = {"score": 0, "player": "player1", "bomberman": (1, 1)}
-
+    newgame_json = await q.get()  # first state message includes map information
     while True:
-        SCREEN.blit(BACKGROUND, (0, 0))
-        pygame.event.pump()
-        if pygame.key.get_pressed()[pygame.K_ESCAPE]:
-            asyncio.get_event_loop().stop()
+        newgame_json = await main_game(q, newgame_json)
+
+
+class Scene:
+    """Retained scene of one game, redrawing only what changed between states.
+
+    Stones, passages and walls are kept in the background surface, walls are
+    only redrawn when they fall. Characters, bombs and items are dirty
+    sprites keyed by enemy id or position that are added, moved and removed
+    as the states change. draw() returns the screen areas that changed."""
+
+    def __init__(self, screen, info):
+        self.screen = screen
+        self.info = info
+        self.mapa = Map(size=info["size"], mapa=info["map"])
+        self.background = draw_background(self.mapa)
+        self.walls = set()
+        self.enemies = {}  # id -> Enemy
+        self.bombs = {}  # position -> Bomb
+        self.items = {}  # (position, name) -> Exit or Powerups
+        self.sprites = pygame.sprite.LayeredDirty()
+        self.sprites.clear(screen, self.background)
+        self.bomberman = BomberMan(pos=self.mapa.bomberman_spawn)
+        self.sprites.add(self.bomberman, layer=1)
+        self.state = {"score": 0, "player": "player1", "bomberman": (1, 1)}
+        self._hud = None
+        self._lag = None
+        self._dirty = [screen.blit(self.background, (0, 0))]
+
+    def new_level(self, level):
+        self.sprites.remove(*self.enemies.values(), *self.bombs.values(), *self.items.values())
+        self.enemies, self.bombs, self.items = {}, {}, {}
+        self.bomberman.update(self.mapa.bomberman_spawn)
+        self.mapa.level = level
+
+    def set_walls(self, walls):
+        walls = {tuple(w) for w in walls}
+        for (x, y), tile in [(w, WALL) for w in walls - self.walls] + [
+            (w, PASSAGE) for w in self.walls - walls
+        ]:
+            self.background.blit(SPRITES, scale((x, y)), (*tile, *scale((1, 1))))
+            self._dirty.append(self.screen.blit(self.background, scale((x, y)), (*scale((x, y)), *scale((1, 1)))))
+        self.walls = walls
+
+    def set_enemies(self, enemies):
+        alive = {e["id"] for e in enemies}
+        for id in [id for id in self.enemies if id not in alive]:
+            self.sprites.remove(self.enemies.pop(id))
+        for enemy in enemies:
+            sprite = self.enemies.get(enemy["id"])
+            if sprite is None:
+                sprite = self.enemies[enemy["id"]] = Enemy(name=enemy["name"], pos=enemy["pos"])
+                self.sprites.add(sprite, layer=2)
+            elif scale(enemy["pos"]) != (sprite.x, sprite.y):
+                sprite.update(enemy["pos"])
+
+    def set_bombs(self, bombs, explosions):
+        blasts = {tuple(cells[0]) for cells in explosions if cells}
+        positions = {tuple(pos) for pos, _, _ in bombs}
+        for pos, bomb in list(self.bombs.items()):
+            if bomb.exploded:
+                self.sprites.remove(self.bombs.pop(pos))
+            elif pos not in positions:
+                if pos in blasts:
+                    bomb.explode()  # shown for one frame
+                else:
+                    self.sprites.remove(self.bombs.pop(pos))
+        for pos, timeout, radius in bombs:
+            if tuple(pos) not in self.bombs:
+                self.bombs[tuple(pos)] = Bomb(pos=pos, timeout=timeout, radius=radius)
+                self.sprites.add(self.bombs[tuple(pos)], layer=3)
+        for bomb in self.bombs.values():
+            if not bomb.exploded:
+                bomb.update(bombs)
+
+    def set_items(self, items):
+        items = {(tuple(pos), name): cls for pos, name, cls in items}
+        for key in [key for key in self.items if key not in items]:
+            self.sprites.remove(self.items.pop(key))
+        for (pos, name), cls in items.items():
+            if (pos, name) not in self.items:
+                if cls is Exit:
+                    sprite = Exit(pos=pos)
+                else:
+                    sprite = Powerups(pos=pos, name=name)
+                self.items[(pos, name)] = sprite
+                self.sprites.add(sprite, layer=0)
+
+    def update(self, state):
+        if (
+            "step" in state
+            and state["step"] == 1
+            or "level" in state
+            and state["level"] != self.mapa.level
+        ):
+            self.new_level(state["level"])  # New level! lets clean everything up!
 
-        main_group.clear(SCREEN, clear_callback)
-        bombs_group.clear(SCREEN, BACKGROUND)
-        enemies_group.clear(SCREEN, clear_callback)
+        if "walls" in state:
+            self.set_walls(state["walls"])
+        if "enemies" in state:
+            self.set_enemies(state["enemies"])
+        if "bombs" in state:
+            self.set_bombs(state["bombs"], state.get("explosions", []))
+        if "powerups" in state:
+            items = [(pos, name, Powerups) for pos, name in state["powerups"]]
+            if state.get("exit"):
+                items.append((state["exit"], "exit", Exit))
+            self.set_items(items)
+        if "bomberman" in state and scale(state["bomberman"]) != (self.bomberman.x, self.bomberman.y):
+            self.bomberman.update(state["bomberman"])
+        self.state = state
+
+    def draw_hud(self):
+        state = self.state
+        hud = tuple(state.get(k) for k in ("score", "player", "lives", "level", "step"))
+        if hud == self._hud:
+            return
+        self._hud = hud
+        SCREEN = self.screen
+        top = pygame.Rect(0, 0, SCREEN.get_width(), scale((1, 1))[1])
+        SCREEN.blit(self.background, top, top)
+        self._dirty.append(top)
 
         if "score" in state and "player" in state:
             text = str(state["score"])
@@ -402,143 +605,111 @@ async def main_game():
         if "lives" in state and "level" in state:
             w,h = draw_info(SCREEN, "lives: ", (SCREEN.get_width()/4,1))
             draw_info(SCREEN, f"{state['lives']}", (SCREEN.get_width()/4 + w ,1),color=(255, 0, 0))
-            w,h = draw_info(SCREEN, "level: ", (2*SCREEN.get_width()/4 ,1))        
+            w,h = draw_info(SCREEN, "level: ", (2*SCREEN.get_width()/4 ,1))
             draw_info(SCREEN, f"{state['level']}", (2*SCREEN.get_width()/4 + w,1),color=(255, 0, 0))
-        
+
         if "step" in state:
             w,h = draw_info(SCREEN, "steps: ", (3*SCREEN.get_width()/4,1))
-            draw_info(SCREEN, f"{state['step']}", (3*SCREEN.get_width()/4 + w ,1),color=(255, 0, 0))               
-
-        if "bombs" in state:
-            for bomb in bombs_group:
-                if bomb.exploded:
-                    bombs_group.remove(bomb)
-            if len(bombs_group.sprites()) < len(state["bombs"]):
-                pos, timeout, radius = state["bombs"][-1]
-                bombs_group.add(Bomb(pos=pos, timeout=timeout, radius=radius))
-            if len(bombs_group.sprites()) > len(state["bombs"]):
-                bombs_group.empty()
-            bombs_group.update(state["bombs"])
-
-        if "enemies" in state:
-            enemies_group.empty()
-            for enemy in state["enemies"]:
-                enemies_group.add(Enemy(name=enemy["name"], pos=enemy["pos"]))
-
-        if "walls" in state:
-            walls_group.empty()
-            for wall in state["walls"]:
-                walls_group.add(Wall(pos=wall))
-
-        if "exit" in state and len(state["exit"]):
-            if not [p for p in main_group if isinstance(p, Exit)]:
-                logger.debug("Add Exit")
-                ex = Exit(pos=state["exit"])
-                main_group.add(ex)
-                main_group.move_to_back(ex)
-
-        if "powerups" in state:
-            for pos, name in state["powerups"]:
-                if name not in [p.type for p in main_group if isinstance(p, Powerups)]:
-                    logger.debug(f"Add {name}")
-                    p = Powerups(pos=pos, name=name)
-                    main_group.add(p)
-                    main_group.move_to_back(p)
-            for powerup in main_group:
-                if isinstance(powerup, Powerups):
-                    name = powerup.type
-                    if name not in [p[1] for p in state["powerups"]]:
-                        logger.debug(f"Remove {name}")
-                        main_group.remove(powerup)
-
-        walls_group.draw(SCREEN)
-        main_group.draw(SCREEN)
-        enemies_group.draw(SCREEN)
-        bombs_group.draw(SCREEN)
-
-        # Highscores Board
-        if (
-            ("lives" in state and state["lives"] == 0)
-            or ("step" in state and state["step"] >= TIMEOUT)
-            or (
-                "bomberman" in state
-                and "exit" in state
-                and state["bomberman"] == state["exit"]
-                and "enemies" in state
-                and state["enemies"] == []
+            draw_info(SCREEN, f"{state['step']}", (3*SCREEN.get_width()/4 + w ,1),color=(255, 0, 0))
+
+    def draw_highscores(self):
+        state = self.state
+        highscores = self.info["highscores"]
+        if (f"<{state['player']}>", state["score"]) not in highscores:
+            highscores.append((f"<{state['player']}>", state["score"]))
+        highscores = sorted(highscores, key=lambda s: s[1], reverse=True)[:-1]
+        highscores = highscores[:len(RANKS)]
+
+        HIGHSCORES = pygame.Surface(scale((20, 16)))
+        HIGHSCORES.fill(COLORS["grey"])
+
+        draw_info(HIGHSCORES, "THE 10 BEST PLAYERS", scale((5, 1)), COLORS["white"])
+        draw_info(HIGHSCORES, "RANK", scale((2, 3)), COLORS["orange"])
+        draw_info(HIGHSCORES, "SCORE", scale((6, 3)), COLORS["orange"])
+        draw_info(HIGHSCORES, "NAME", scale((11, 3)), COLORS["orange"])
+
+        for i, highscore in enumerate(highscores):
+            c = (i % 5) + 1
+            draw_info(
+                HIGHSCORES,
+                RANKS[i + 1],
+                scale((2, i + 5)),
+                list(COLORS.values())[c],
             )
-        ):
-            highscores = newgame_json["highscores"]
-            if (f"<{state['player']}>", state["score"]) not in highscores:
-                highscores.append((f"<{state['player']}>", state["score"]))
-            highscores = sorted(highscores, key=lambda s: s[1], reverse=True)[:-1]
-            highscores = highscores[:len(RANKS)]
-
-            HIGHSCORES = pygame.Surface(scale((20, 16)))
-            HIGHSCORES.fill(COLORS["grey"])
-
-            draw_info(HIGHSCORES, "THE 10 BEST PLAYERS", scale((5, 1)), COLORS["white"])
-            draw_info(HIGHSCORES, "RANK", scale((2, 3)), COLORS["orange"])
-            draw_info(HIGHSCORES, "SCORE", scale((6, 3)), COLORS["orange"])
-            draw_info(HIGHSCORES, "NAME", scale((11, 3)), COLORS["orange"])
-
-            for i, highscore in enumerate(highscores):
-                c = (i % 5) + 1
-                draw_info(
-                    HIGHSCORES,
-                    RANKS[i + 1],
-                    scale((2, i + 5)),
-                    list(COLORS.values())[c],
-                )
-                draw_info(
-                    HIGHSCORES,
-                    str(highscore[1]),
-                    scale((6, i + 5)),
-                    list(COLORS.values())[c],
-                )
-                draw_info(
-                    HIGHSCORES,
-                    highscore[0],
-                    scale((11, i + 5)),
-                    list(COLORS.values())[c],
-                )
-
-            SCREEN.blit(
+            draw_info(
+                HIGHSCORES,
+                str(highscore[1]),
+                scale((6, i + 5)),
+                list(COLORS.values())[c],
+            )
+            draw_info(
+                HIGHSCORES,
+                highscore[0],
+                scale((11, i + 5)),
+                list(COLORS.values())[c],
+            )
+
+        self._dirty.append(
+            self.screen.blit(
                 HIGHSCORES,
                 (
-                    (SCREEN.get_width() - HIGHSCORES.get_width()) / 2,
-                    (SCREEN.get_height() - HIGHSCORES.get_height()) / 2,
+                    (self.screen.get_width() - HIGHSCORES.get_width()) / 2,
+                    (self.screen.get_height() - HIGHSCORES.get_height()) / 2,
                 ),
             )
+        )
 
-        if "bomberman" in state:
-            main_group.update(state["bomberman"])
-
-        pygame.display.flip()
+    def draw_lag(self, lag, dropped):
+        """Show how late the drawn state is and how many were skipped."""
+        status = (round(lag, 1), dropped)
+        if status == self._lag:
+            return
+        self._lag = status
+        height = scale((1, 1))[1]
+        bottom = pygame.Rect(0, self.screen.get_height() - height, self.screen.get_width(), height)
+        self.screen.blit(self.background, bottom, bottom)
+        self._dirty.append(bottom)
+        if lag >= 0.1 or dropped:
+            draw_info(self.screen, f"lag: {lag:.1f}s skipped: {dropped}", (5, bottom.y + 1), COLORS["white"])
+
+    def draw(self):
+        """Draw what changed since the last call, returns the dirty rects."""
+        self.draw_hud()
+        dirty = self._dirty + self.sprites.draw(self.screen)
+        if game_over(self.state, self.info["timeout"]):
+            self.draw_highscores()
+            dirty += self._dirty[-1:]
+        self._dirty = []
+        return dirty
+
+
+async def main_game(q, newgame_json):
+    """Draw one game until the game info of the next one arrives, returns it."""
+    global SPRITES, SCREEN
 
-        try:
-            state = json.loads(q.get_nowait())
+    logging.debug("Initial game status: %s", newgame_json)
 
-            if (
-                "step" in state
-                and state["step"] == 1
-                or "level" in state
-                and state["level"] != mapa.level
-            ):
+    GAME_SPEED = newgame_json["fps"]
+    SCREEN = pygame.display.set_mode(scale(newgame_json["size"]))
+    if SPRITES is None:
+        SPRITES = pygame.image.load("data/nes.png").convert_alpha()
+    scene = Scene(SCREEN, newgame_json)
 
-                # New level! lets clean everything up!
-                SCREEN.blit(BACKGROUND, (0, 0))
+    while True:
+        pygame.event.pump()
+        if pygame.key.get_pressed()[pygame.K_ESCAPE]:
+            asyncio.get_event_loop().stop()
 
-                walls_group.empty()
-                main_group.empty()
-                enemies_group.empty()
-                bombs_group.empty()
-                main_group.add(BomberMan(pos=mapa.bomberman_spawn))
-                mapa.level = state["level"]
+        scene.draw_lag(q.lag, q.dropped)
+        pygame.display.update(scene.draw())
 
-        except asyncio.queues.QueueEmpty:
+        state = q.get_nowait()
+        if state is None:
             await asyncio.sleep(1.0 / GAME_SPEED)
-            continue
+        elif "map" in state:
+            return state  # next game
+        else:
+            scene.update(state)
 
 
 if __name__ == "__main__":
@@ -551,18 +722,36 @@ if __name__ == "__main__":
         "--scale", help="reduce size of window by x times", type=int, default=1
     )
     parser.add_argument("--port", help="TCP port", type=int, default=PORT)
+    parser.add_argument(
+        "--session", help="id of the game session to watch", type=int, default=None
+    )
+    parser.add_argument(
+        "--encoding",
+        help="how the server encodes state frames",
+        choices=ENCODINGS,
+        default="json",
+    )
+    parser.add_argument(
+        "--fps", help="ask the server for fewer frames per second", type=int, default=None
+    )
+    parser.add_argument(
+        "--max-staleness",
+        help="seconds a level change may wait to be drawn before it is skipped",
+        type=float,
+        default=MAX_STALENESS,
+    )
     args = parser.parse_args()
     SCALE = args.scale
 
     LOOP = asyncio.get_event_loop()
     pygame.font.init()
-    q = asyncio.Queue()
+    q = Mailbox(args.max_staleness)
 
     ws_path = f"ws://{args.server}:{args.port}/viewer"
 
     try:
         LOOP.run_until_complete(
-            asyncio.gather(messages_handler(ws_path, q), main_loop(q))
+            asyncio.gather(messages_handler(ws_path, q, args.encoding, args.session, args.fps), main_loop(q))
         )
     finally:
         LOOP.stop()